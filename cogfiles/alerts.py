@@ -1,4 +1,5 @@
 from ioutils import read_sql, write_sql, DATABASE_SETTINGS
+from cogfiles.resolver import resolve_channel, resolve_member
 
 import discord, datetime
 from discord.ext import commands, tasks
@@ -11,6 +12,7 @@ class EventAlerts(commands.Cog, name="Event Alerts"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.yet_to_ping: set[discord.ScheduledEvent] = set()
+        self.announcement_loops: dict[int, tasks.Loop] = {}
     
     @commands.Cog.listener()
     async def on_ready(self):
@@ -19,11 +21,40 @@ class EventAlerts(commands.Cog, name="Event Alerts"):
                 await self.create_wait_until_announcement_task(event)
                 self.yet_to_ping.add(event)
 
+    async def cog_unload(self):
+        for loop in self.announcement_loops.values():
+            loop.cancel()
+
+    def export_state(self) -> dict:
+        return {"yet_to_ping": self.yet_to_ping}
+
+    async def import_state(self, state: dict):
+        """Take over the events still waiting to be announced by a previous version of this cog, and wait for them again."""
+
+        self.yet_to_ping = state["yet_to_ping"]
+        for event in self.yet_to_ping.copy():
+            try:
+                await self.create_wait_until_announcement_task(event)
+            except discord.NotFound:
+                self.forget_event(event) # Deleted since it was created
+
     @commands.Cog.listener()
     async def on_scheduled_event_create(self, event: discord.ScheduledEvent):
         """Send a ping message when an event tied to a role is created."""
         await self.send_event_start_time_message(event)
 
+    @commands.Cog.listener()
+    async def on_scheduled_event_delete(self, event: discord.ScheduledEvent):
+        self.forget_event(event)
+
+    def forget_event(self, event: discord.ScheduledEvent):
+        """Stop waiting to announce an event that no longer exists."""
+
+        self.yet_to_ping.discard(event)
+        loop = self.announcement_loops.pop(event.id, None)
+        if loop is not None:
+            loop.cancel()
+
     @commands.Cog.listener()
     async def on_scheduled_event_update(self, before: discord.ScheduledEvent, after: discord.ScheduledEvent):
         if before.start_time != after.start_time:
@@ -34,7 +65,7 @@ class EventAlerts(commands.Cog, name="Event Alerts"):
         if role is None:
             return
         
-        channel = await event.guild.fetch_channel(read_sql(DATABASE_SETTINGS, event.guild.id, "scheduled_event_alert_channel_id"))
+        channel = await resolve_channel(self.bot, self, read_sql(DATABASE_SETTINGS, event.guild.id, "scheduled_event_alert_channel_id"))
         if isinstance(channel, discord.ForumChannel):
             channel = EventAlerts.get_channel_from_role(channel, role)
         await channel.send(f"{event.name} {'has been rescheduled to' if rescheduling else 'is set for'} {format_dt(event.start_time, style='F')}! {role.mention} \n{event.url}")
@@ -48,11 +79,14 @@ class EventAlerts(commands.Cog, name="Event Alerts"):
         @tasks.loop(time=(event.start_time - datetime.timedelta(minutes=30)).timetz())
         async def wait_until_announcement():
             if datetime.datetime.now(event.start_time.tzinfo).date() == event.start_time.date():
-                event_creator = await event.guild.fetch_member(event.creator.id)
+                event_creator = await resolve_member(self.bot, self, event.guild, event.creator.id)
                 if isinstance(event_creator, discord.Member) and event_creator.voice is not None:
                     await self.send_event_is_starting_message(event)
                     wait_until_announcement.stop()
 
+        if event.id in self.announcement_loops:
+            self.announcement_loops[event.id].cancel() # Replace the loop waiting for the event's previous start time
+        self.announcement_loops[event.id] = wait_until_announcement
         wait_until_announcement.start()
     
     @commands.Cog.listener()
@@ -61,8 +95,12 @@ class EventAlerts(commands.Cog, name="Event Alerts"):
             return
         
         for event in self.yet_to_ping.copy():
-            event = await event.guild.fetch_scheduled_event(event.id)
-            event_creator = await EventAlerts.get_event_creator(event)
+            try:
+                event = await event.guild.fetch_scheduled_event(event.id)
+            except discord.NotFound:
+                self.forget_event(event)
+                continue
+            event_creator = await self.get_event_creator(event)
             if event_creator.id == member.id:
                 await self.send_event_is_starting_message(event)
     
@@ -70,7 +108,7 @@ class EventAlerts(commands.Cog, name="Event Alerts"):
         role = EventAlerts.get_role_from_event(event)
         time_until_event_start = event.start_time - datetime.datetime.now(event.start_time.tzinfo)
         if time_until_event_start <= datetime.timedelta(minutes=30):
-            channel = await event.guild.fetch_channel(read_sql(DATABASE_SETTINGS, event.guild.id, "scheduled_event_alert_channel_id"))
+            channel = await resolve_channel(self.bot, self, read_sql(DATABASE_SETTINGS, event.guild.id, "scheduled_event_alert_channel_id"))
             if isinstance(channel, discord.ForumChannel):
                 channel = EventAlerts.get_channel_from_role(channel, role)
             await channel.send(f"{event.name} is starting {format_dt(event.start_time, style='R')}! {role.mention} \n{event.url}")
@@ -91,10 +129,9 @@ class EventAlerts(commands.Cog, name="Event Alerts"):
         elif isinstance(error, commands.errors.ChannelNotFound):
             await context.send("Channel not found. Try again.")
 
-    @staticmethod
-    async def get_event_creator(event: discord.ScheduledEvent):
+    async def get_event_creator(self, event: discord.ScheduledEvent):
         fetched_event = await event.guild.fetch_scheduled_event(event.id)
-        return await fetched_event.guild.fetch_member(fetched_event.creator.id)
+        return await resolve_member(self.bot, self, fetched_event.guild, fetched_event.creator.id)
 
     @staticmethod
     def get_role_from_event(event: discord.ScheduledEvent) -> discord.Role:
@@ -116,4 +153,8 @@ class EventAlerts(commands.Cog, name="Event Alerts"):
 
     @staticmethod
     def matches_role(channel: discord.TextChannel | discord.Thread | discord.ScheduledEvent, role: discord.Role) -> bool:
-        return " ping" in role.name.lower() and role.name.lower().replace(" ping", "") in channel.name.lower()
\ No newline at end of file
+        return " ping" in role.name.lower() and role.name.lower().replace(" ping", "") in channel.name.lower()
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(EventAlerts(bot))
@@ -1,60 +1,274 @@
-import datetime, pytz
-from ioutils import read_sql, write_sql, DATABASE_SETTINGS
+import asyncio, copy, datetime, heapq, itertools, json, psycopg2.errors, pytz, traceback
+from ioutils import RandomColorEmbed, read_sql, write_sql, DATABASE_SETTINGS
+from cogfiles.leases import holds_lease, want_lease
+from cogfiles.resolver import resolve_channel
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
+from discord.utils import format_dt
+
+
+DEFAULT_ANNOUNCEMENTS = {
+    "ninja_troll": {"schedule": "0 17 * * 5", "timezone": "US/Eastern", "media": "ninja_troll.png"}, # Fridays at 5:00 PM EST
+    "first_of_the_month": {"schedule": "0 0 1 * *", "timezone": "US/Eastern", "media": "first_of_the_month.mov"} # 1st of the month at 12:00 AM EST
+}
+
+class CronSchedule:
+    """A cron-style schedule made of five fields: minute, hour, day of month, month and day of week (0 or 7 is Sunday)."""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected 5 schedule fields, got {len(fields)}")
+
+        self.minutes = sorted(CronSchedule.parse_field(fields[0], 0, 59))
+        self.hours = sorted(CronSchedule.parse_field(fields[1], 0, 23))
+        self.days = CronSchedule.parse_field(fields[2], 1, 31)
+        self.months = CronSchedule.parse_field(fields[3], 1, 12)
+        self.weekdays = {weekday % 7 for weekday in CronSchedule.parse_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def parse_field(field: str, low: int, high: int) -> set[int]:
+        """Convert a field made of comma-separated values, ranges and steps (like "1-5" or "*/15") into the values it allows."""
+
+        values = set()
+        for part in field.split(","):
+            range_str, _, step_str = part.partition("/")
+            if range_str == "*":
+                start, end = low, high
+            elif "-" in range_str:
+                start, end = map(int, range_str.split("-"))
+            else:
+                start = end = int(range_str)
+                if step_str:
+                    end = high
+            step = int(step_str) if step_str else 1
+
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Schedule field {field!r} is out of range")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def matches_date(self, date: datetime.date) -> bool:
+        # As in cron, a date matches either restricted day field when both are restricted
+        matches_day = date.day in self.days
+        matches_weekday = date.isoweekday() % 7 in self.weekdays
+        if self.any_day:
+            return matches_weekday
+        if self.any_weekday:
+            return matches_day
+        return matches_day or matches_weekday
+
+    def next_fire(self, after: datetime.datetime, timezone: datetime.tzinfo) -> datetime.datetime:
+        """Find the first time strictly after the given time that matches the schedule, in UTC."""
+
+        date = after.astimezone(timezone).date()
+        for _ in range(366 * 8): # Long enough to reach a leap day
+            if date.month in self.months and self.matches_date(date):
+                for hour, minute in itertools.product(self.hours, self.minutes):
+                    fire_time = timezone.localize(datetime.datetime.combine(date, datetime.time(hour, minute)))
+                    if fire_time > after:
+                        return fire_time.astimezone(pytz.utc)
+            date += datetime.timedelta(days=1)
+        raise ValueError("Schedule never fires")
 
 
 class Announcements(commands.Cog, name="Periodic Announcements"):
     """Periodically send specific messages in certain channels at scheduled times."""
-    
+
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.announcement_data: dict[int, dict[str, dict[str, str]]] = {}
+        self.queue: list[tuple[datetime.datetime, int, int, str, dict[str, str]]] = []
+        self._queue_order = itertools.count()
+        self._queue_changed = asyncio.Event()
+        self._scheduler: asyncio.Task = None
+        self._sending = False
+        self._stopping = False
 
     @commands.Cog.listener()
     async def on_ready(self):
-        """Start the periodic announcements processing loop."""
+        """Load every server's announcements and start the scheduler."""
+
+        want_lease(self.bot, "announcements")
+        if self._scheduler is not None:
+            return
+
+        for guild in self.bot.guilds:
+            self.load_guild(guild.id)
+
+        self._scheduler = self.bot.loop.create_task(self.run_scheduler())
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        """Load a new server's announcements, which are the defaults unless it was in this server before."""
+
+        self.load_guild(guild.id)
+
+    def load_guild(self, guild_id: int):
+        """Read a server's announcements, falling back to the defaults, and schedule them."""
+
+        try:
+            guild_announcements = read_sql(DATABASE_SETTINGS, guild_id, "announcements")
+        except psycopg2.errors.UndefinedColumn:
+            print(f"The {DATABASE_SETTINGS} table has no announcements column, using the default announcements. See the README to add it.")
+            guild_announcements = None
+
+        # Replacing the server's announcements leaves any already queued for it to be skipped by the scheduler
+        self.announcement_data[guild_id] = copy.deepcopy(DEFAULT_ANNOUNCEMENTS) if guild_announcements is None else guild_announcements
+        for name, announcement in self.announcement_data[guild_id].items():
+            self.schedule(guild_id, name, announcement)
+
+    async def cog_unload(self):
+        """Stop the scheduler, letting it finish sending an announcement first so it is not cut off partway."""
+
+        if self._scheduler is None:
+            return
+        if self._sending:
+            self._stopping = True
+            await self._scheduler
+        else:
+            self._scheduler.cancel()
+
+    def export_state(self) -> dict:
+        return {"announcement_data": self.announcement_data, "queue": self.queue}
+
+    async def import_state(self, state: dict):
+        """Take over the announcements and queue of a previous version of this cog, then restart the scheduler.
+
+        Keeping the queue, rather than scheduling from now, still sends announcements that became due during the reload."""
+
+        self.announcement_data = state["announcement_data"]
+        self.queue = state["queue"]
+        heapq.heapify(self.queue)
+        self._queue_order = itertools.count(max([order for _, order, *_ in self.queue], default=-1) + 1)
+
+        self._scheduler = self.bot.loop.create_task(self.run_scheduler())
 
-        self.ninja_troll.start()
-        self.first_of_the_month.start()
+    def schedule(self, guild_id: int, name: str, announcement: dict[str, str], after: datetime.datetime = None):
+        """Queue the next time an announcement should be sent."""
 
-    @commands.command()
+        after = after or datetime.datetime.now(pytz.utc)
+        fire_time = CronSchedule(announcement["schedule"]).next_fire(after, pytz.timezone(announcement["timezone"]))
+        heapq.heappush(self.queue, (fire_time, next(self._queue_order), guild_id, name, announcement))
+        self._queue_changed.set()
+
+    async def run_scheduler(self):
+        """Sleep until the earliest queued announcement is due, send it, and queue its next occurrence."""
+
+        while not self._stopping:
+            self._queue_changed.clear()
+            timeout = (self.queue[0][0] - datetime.datetime.now(pytz.utc)).total_seconds() if self.queue else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._queue_changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            fire_time, _, guild_id, name, announcement = heapq.heappop(self.queue)
+            if self.announcement_data.get(guild_id, {}).get(name) is not announcement: # Removed or replaced since it was queued
+                continue
+            self.schedule(guild_id, name, announcement, after=fire_time)
+
+            if holds_lease(self.bot, "announcements"):
+                self._sending = True
+                try:
+                    await self.send_announcement(guild_id, announcement)
+                except Exception:
+                    print(f"Failed to send announcement {name!r} in guild {guild_id}:")
+                    traceback.print_exc() # Keep the scheduler running for every other announcement
+                finally:
+                    self._sending = False
+
+    async def send_announcement(self, guild_id: int, announcement: dict[str, str]):
+        channel_id = read_sql(DATABASE_SETTINGS, guild_id, "periodic_announcement_channel_id")
+        if channel_id is None:
+            return
+
+        channel = await resolve_channel(self.bot, self, channel_id)
+        media = announcement["media"]
+        if media.startswith(("http://", "https://")):
+            await channel.send(media)
+        else:
+            await channel.send(file=discord.File(media))
+
+    @commands.group(invoke_without_command=True)
     @commands.has_guild_permissions(manage_guild=True)
     async def announcements(self, context: commands.Context, channel: discord.TextChannel):
         """Set which channel to send periodic announcement messages."""
-        
+
         write_sql(DATABASE_SETTINGS, context.guild.id, "periodic_announcement_channel_id", channel.id)
         await context.send(f"Periodic announcement channel is set to {channel.mention}")
 
+    @announcements.command()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def add(self, context: commands.Context, name: str, schedule: str, timezone: str, media: str = None):
+        """Add or replace an announcement. Quote the schedule, formatted as "minute hour day month weekday", and give a media link or attachment."""
+
+        if media is None and len(context.message.attachments) > 0:
+            media = context.message.attachments[0].url
+        if media is None or not media.startswith(("http://", "https://")):
+            await context.send("Announcements need a media link or attachment.")
+            return
+
+        try:
+            CronSchedule(schedule).next_fire(datetime.datetime.now(pytz.utc), pytz.timezone(timezone))
+        except ValueError as error:
+            await context.send(f"Schedule is not formatted correctly: {error}.")
+            return
+        except pytz.UnknownTimeZoneError:
+            await context.send(f"Unknown timezone {timezone!r}. Try a name like US/Eastern.")
+            return
+
+        announcement = {"schedule": schedule, "timezone": timezone, "media": media}
+        self.announcement_data.setdefault(context.guild.id, copy.deepcopy(DEFAULT_ANNOUNCEMENTS))[name] = announcement
+        write_sql(DATABASE_SETTINGS, context.guild.id, "announcements", json.dumps(self.announcement_data[context.guild.id]))
+        self.schedule(context.guild.id, name, announcement)
+        await context.message.add_reaction("👍")
+
+    @announcements.command()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def remove(self, context: commands.Context, name: str):
+        """Remove an announcement."""
+
+        if self.announcement_data.get(context.guild.id, {}).pop(name, None) is None:
+            await context.send(f"No announcement named {name!r}.")
+            return
+
+        write_sql(DATABASE_SETTINGS, context.guild.id, "announcements", json.dumps(self.announcement_data[context.guild.id]))
+        await context.message.add_reaction("👍")
+
+    @announcements.command(name="list")
+    async def list_announcements(self, context: commands.Context):
+        """View this server's announcements and when they will next be sent."""
+
+        guild_announcements = self.announcement_data.get(context.guild.id, {})
+        if len(guild_announcements) == 0:
+            await context.send("No announcements currently set.")
+            return
+
+        now = datetime.datetime.now(pytz.utc)
+        announcement_list = RandomColorEmbed(
+            title="Periodic Announcements",
+            description='\n'.join([
+                f"**{name}** `{announcement['schedule']}` ({announcement['timezone']}), next {format_dt(CronSchedule(announcement['schedule']).next_fire(now, pytz.timezone(announcement['timezone'])), style='F')}"
+                for name, announcement in guild_announcements.items()
+            ])
+        )
+        await context.send(embed=announcement_list)
+
     @announcements.error
+    @add.error
+    @remove.error
     async def permissions_or_channel_fail(self, context: commands.Context, error: commands.errors.CommandError):
         if isinstance(error, commands.errors.MissingPermissions):
             await context.send("User needs Manage Server permission to use this command.")
         elif isinstance(error, commands.errors.ChannelNotFound):
             await context.send("Channel not found. Try again.")
 
-    @tasks.loop(time=datetime.time(hour=17, minute=0, second=0, tzinfo=pytz.timezone("US/Eastern"))) # 5:00 PM EST
-    async def ninja_troll(self):
-        """Send periodic announcement messages at their appropriate times."""
-        
-        if datetime.date.today().weekday() != 4: # Friday
-            return
-        
-        for guild in self.bot.guilds:
-            channel_id = read_sql(DATABASE_SETTINGS, guild.id, "periodic_announcement_channel_id")
-            if channel_id is not None:
-                channel = await self.bot.fetch_channel(channel_id)
-                await channel.send(file=discord.File("ninja_troll.png"))
-
-    @tasks.loop(time=datetime.time(hour=0, minute=0, second=0, tzinfo=pytz.timezone("US/Eastern"))) # 12:00 AM EST
-    async def first_of_the_month(self):
-        """Send periodic announcement messages at their appropriate times."""
-        
-        if datetime.date.today().day != 1: # 1st day of the month
-            return
-        
-        for guild in self.bot.guilds:
-            channel_id = read_sql(DATABASE_SETTINGS, guild.id, "periodic_announcement_channel_id")
-            if channel_id is not None:
-                channel = await self.bot.fetch_channel(channel_id)
-                await channel.send(file=discord.File("first_of_the_month.mov"))
\ No newline at end of file
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Announcements(bot))
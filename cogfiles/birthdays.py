@@ -1,6 +1,8 @@
 import datetime, json, pytz
-from ioutils import read_sql, write_sql, DATABASE_SETTINGS
+from ioutils import read_sql, write_sql, settings_writes, DATABASE_SETTINGS
 from dateutil.parser import parse
+from cogfiles.leases import holds_lease, want_lease
+from cogfiles.resolver import resolve_channel, resolve_user
 
 import discord
 from discord.ext import commands, tasks
@@ -11,6 +13,7 @@ class Birthdays(commands.Cog, name="Birthdays"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.birthdays: dict[int, dict[int, str]] = {}
+        self._sending = False
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -18,13 +21,30 @@ class Birthdays(commands.Cog, name="Birthdays"):
         for guild in self.bot.guilds:
             guild_birthdays = read_sql(DATABASE_SETTINGS, guild.id, "birthdays")
             if guild_birthdays is None:
-                write_sql(DATABASE_SETTINGS, guild.id, "birthdays", json.dumps({}))
+                settings_writes.write(guild.id, "birthdays", json.dumps({}))
                 self.birthdays[guild.id] = {}
             else:
                 self.birthdays[guild.id] = guild_birthdays
 
+        want_lease(self.bot, "birthdays")
         self.send_birthday_message.start()
 
+    async def cog_unload(self):
+        """Let the birthday loop finish sending today's messages, so none are skipped after a reload."""
+
+        if self._sending:
+            self.send_birthday_message.stop()
+            await self.send_birthday_message.get_task()
+        else:
+            self.send_birthday_message.cancel() # Stopping would wait until midnight for the next iteration
+
+    def export_state(self) -> dict:
+        return {"birthdays": self.birthdays}
+
+    async def import_state(self, state: dict):
+        """Take over the birthdays of a previous version of this cog, then restart the birthday loop."""
+        self.birthdays = state["birthdays"]
+        self.send_birthday_message.start()
 
     @commands.group(invoke_without_command=True)
     async def birthday(self, context: commands.Context, *, date_str: str):
@@ -37,7 +57,7 @@ class Birthdays(commands.Cog, name="Birthdays"):
         if self.birthdays[context.guild.id] is None:
             self.birthdays[context.guild.id] = {}
         self.birthdays[context.guild.id][str(context.author.id)] = date.isoformat()
-        write_sql(DATABASE_SETTINGS, context.guild.id, "birthdays", json.dumps(self.birthdays[context.guild.id]))
+        settings_writes.write(context.guild.id, "birthdays", json.dumps(self.birthdays[context.guild.id]))
         await context.message.add_reaction("👍")
 
     @birthday.command()
@@ -57,24 +77,30 @@ class Birthdays(commands.Cog, name="Birthdays"):
     @tasks.loop(time=datetime.time(hour=0, minute=0, second=0, tzinfo=pytz.timezone("US/Eastern"))) # 12:00 AM EST
     async def send_birthday_message(self):
         """Sends a message to users on their birthday at midnight EST."""
-        for guild in self.bot.guilds:
-            channel_id = read_sql(DATABASE_SETTINGS, guild.id, "birthday_channel_id")
-            if channel_id is None:
-                return
+        if not holds_lease(self.bot, "birthdays"):
+            return
+        self._sending = True
+        try:
+            for guild in self.bot.guilds:
+                channel_id = read_sql(DATABASE_SETTINGS, guild.id, "birthday_channel_id")
+                if channel_id is None:
+                    return
             
-            for user_id, birthday_iso in self.birthdays[guild.id].items():
-                birthday = datetime.datetime.strptime(birthday_iso, "%Y-%m-%d")
-                now = datetime.datetime.now(tzinfo=pytz.timezone("US/Eastern"))
-                if birthday.month == now.month and birthday.day == now.day:
-                    # Send birthday message in the correct channel
-                    user = await self.bot.fetch_user(user_id)
-                    channel = await self.bot.fetch_channel(channel_id)
+                for user_id, birthday_iso in self.birthdays[guild.id].items():
+                    birthday = datetime.datetime.strptime(birthday_iso, "%Y-%m-%d")
+                    now = datetime.datetime.now(tzinfo=pytz.timezone("US/Eastern"))
+                    if birthday.month == now.month and birthday.day == now.day:
+                        # Send birthday message in the correct channel
+                        user = await resolve_user(self.bot, self, int(user_id))
+                        channel = await resolve_channel(self.bot, self, channel_id)
                     
-                    if birthday.year == 0:
-                        await channel.send(f"Happy birthday {user.mention}!")
-                    else:
-                        age = now.year - birthday.year
-                        await channel.send(f"Happy {ordinal(age)} birthday {user.mention}!")
+                        if birthday.year == 0:
+                            await channel.send(f"Happy birthday {user.mention}!")
+                        else:
+                            age = now.year - birthday.year
+                            await channel.send(f"Happy {ordinal(age)} birthday {user.mention}!")
+        finally:
+            self._sending = False
 
 
 def ordinal(n: int) -> str:
@@ -86,4 +112,8 @@ def ordinal(n: int) -> str:
         return f"{n}nd"
     if n % 10 == 3:
         return f"{n}rd"
-    return f"{n}th"
\ No newline at end of file
+    return f"{n}th"
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Birthdays(bot))
@@ -1,25 +1,37 @@
 import discord, json, os
+from ioutils import read_json
 
-from dotenv import load_dotenv
 from discord.ext import commands
 
 
+COPYPASTAS_FILE = os.getenv("COPYPASTAS_FILE", default="copypastas.json")
+
 class Copypastas(commands.Cog, name="Message Copypastas"):
     """Send a copypasta whenever a key phrase is found in a message."""
-    
+
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-    
+        self.env_copypastas: dict[str, str] = json.loads(os.getenv("COPYPASTAS", default="{}"))
+
+    def get_copypastas(self) -> dict[str, str]:
+        """Read the copypastas from the copypastas file, which can be edited while the bot is running, or from the COPYPASTAS variable if there is no file."""
+
+        if os.path.isfile(COPYPASTAS_FILE):
+            return read_json(COPYPASTAS_FILE)
+        return self.env_copypastas
+
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         """Detect key phrases in messages."""
 
         if message.author == self.bot.user:
             return
-        
-        load_dotenv()
-        copypastas_json = os.getenv("COPYPASTAS")
-        copypastas = json.loads(copypastas_json)
+
+        copypastas = self.get_copypastas()
         for phrase in copypastas:
             if phrase in message.content.lower():
-                await message.channel.send(copypastas[phrase])
\ No newline at end of file
+                await message.channel.send(copypastas[phrase])
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Copypastas(bot))
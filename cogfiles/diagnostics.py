@@ -0,0 +1,151 @@
+import asyncio, collections, datetime, os, sys, threading, time
+from ioutils import RandomColorEmbed, get_handler_name
+
+from discord.ext import commands, tasks
+
+
+SLOW_CALLBACK_THRESHOLD = float(os.getenv("SLOW_CALLBACK_THRESHOLD", default="0.1")) # Seconds the event loop may be blocked before it is reported
+PROFILE_DIRECTORY = os.getenv("PROFILE_DIRECTORY", default="profiles")
+PROFILE_INTERVAL = 0.005 # Seconds between profiler samples
+
+class Diagnostics(commands.Cog, name="Diagnostics"):
+    """Report which handlers block the event loop, and profile the bot on demand."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.stalls: collections.Counter[str] = collections.Counter()
+        self.samples: collections.Counter[str] | None = None
+
+        self._loop_thread_id: int = None
+        self._last_heartbeat = time.monotonic()
+        self._stopped = threading.Event()
+        self._watchdog: threading.Thread = None
+        self._profiler: threading.Thread = None
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await self.start_watching()
+
+    async def start_watching(self):
+        """Turn on asyncio's slow callback reporting and start watching the event loop for stalls."""
+
+        if self._watchdog is not None:
+            return
+
+        loop = asyncio.get_running_loop()
+        loop.set_debug(True)
+        loop.slow_callback_duration = SLOW_CALLBACK_THRESHOLD
+
+        self._loop_thread_id = threading.get_ident()
+        self.heartbeat.start()
+        self._watchdog = threading.Thread(target=self.watch_for_stalls, name="diagnostics-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def cog_unload(self):
+        self._stopped.set()
+        self.samples = None
+        self.heartbeat.cancel()
+        asyncio.get_running_loop().set_debug(False)
+
+    def export_state(self) -> dict:
+        return {"stalls": self.stalls}
+
+    async def import_state(self, state: dict):
+        """Keep the stall counts of a previous version of this cog, then start watching the event loop again."""
+
+        self.stalls = state["stalls"]
+        await self.start_watching()
+
+    @tasks.loop(seconds=SLOW_CALLBACK_THRESHOLD / 2)
+    async def heartbeat(self):
+        """Record that the event loop is still running callbacks."""
+
+        self._last_heartbeat = time.monotonic()
+
+    def watch_for_stalls(self):
+        """Sample the event loop thread whenever its heartbeat is late, and blame the cog handler on its stack."""
+
+        reported_heartbeat = None
+        while not self._stopped.wait(SLOW_CALLBACK_THRESHOLD / 2):
+            last_heartbeat = self._last_heartbeat
+            stall_duration = time.monotonic() - last_heartbeat
+            if stall_duration < SLOW_CALLBACK_THRESHOLD or last_heartbeat == reported_heartbeat:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            handler = get_handler_name(frame)
+            self.stalls[handler] += 1
+            reported_heartbeat = last_heartbeat # Only report each stall once
+            print(f"Event loop blocked for over {stall_duration:.3f}s by {handler}", file=sys.stderr)
+
+    def sample_stacks(self, samples: collections.Counter[str]):
+        """Count the event loop thread's stacks until this profiling session is stopped."""
+
+        while self.samples is samples and not self._stopped.wait(PROFILE_INTERVAL):
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                samples[Diagnostics.get_folded_stack(frame)] += 1
+
+    @commands.group(invoke_without_command=True)
+    @commands.is_owner()
+    async def diagnostics(self, context: commands.Context):
+        """Show the handlers that have blocked the event loop most often."""
+
+        stall_list = RandomColorEmbed(
+            title="Event Loop Stalls",
+            description='\n'.join([f"{i+1}. {handler}: {count}" for i, (handler, count) in enumerate(self.stalls.most_common(10))]) or "No stalls detected."
+        )
+        await context.send(embed=stall_list)
+
+    @diagnostics.command()
+    @commands.is_owner()
+    async def profile(self, context: commands.Context):
+        """Start the sampling profiler, or stop it and save the samples as folded stacks for a flamegraph."""
+
+        if self._loop_thread_id is None:
+            await context.send("Diagnostics have not started yet.")
+            return
+
+        if self.samples is None:
+            self.samples = collections.Counter()
+            self._profiler = threading.Thread(target=self.sample_stacks, args=(self.samples,), name="diagnostics-profiler", daemon=True)
+            self._profiler.start()
+            await context.send("Profiler started.")
+            return
+
+        samples, self.samples = self.samples, None
+        profiler, self._profiler = self._profiler, None
+        await asyncio.to_thread(profiler.join) # Wait for the last sample, so the counter is not written while it changes
+        file_name = os.path.join(PROFILE_DIRECTORY, f"profile-{datetime.datetime.now():%Y%m%d-%H%M%S}.folded")
+        await asyncio.to_thread(Diagnostics.write_folded_stacks, file_name, samples)
+        await context.send(f"Profiler stopped. Saved {sum(samples.values())} samples to `{file_name}`.")
+
+    @diagnostics.error
+    @profile.error
+    async def permissions_fail(self, context: commands.Context, error: commands.errors.CommandError):
+        if isinstance(error, commands.errors.NotOwner):
+            await context.send("Only the bot owner can use this command.")
+
+    @staticmethod
+    def write_folded_stacks(file_name: str, samples: collections.Counter[str]):
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, "w") as file:
+            for stack, count in samples.items():
+                file.write(f"{stack} {count}\n")
+
+    @staticmethod
+    def get_folded_stack(frame) -> str:
+        """Convert a stack into a single line of frames, outermost first, as read by flamegraph tools."""
+
+        stack = []
+        while frame is not None:
+            stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Diagnostics(bot))
@@ -0,0 +1,95 @@
+import asyncio, os, time
+from ioutils import claim_lease, release_lease, DATABASE_LEASES, REPLICA_ID
+
+from discord.ext import commands, tasks
+
+
+LEASE_DURATION = 15 # Seconds before an unrenewed lease can be taken over by another replica
+LEASE_MARGIN = 3 # Seconds before a lease expires that this replica stops acting on it, to allow for a slow renewal
+LEASES_ENABLED = os.getenv("ENABLE_LEASES") is not None
+
+class Leases(commands.Cog, name="Leases"):
+    """Coordinate scheduled jobs between bot replicas, so that each job is only run by the replica holding its lease."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.wanted: set[str] = set()
+        self.held: dict[str, float] = {} # Monotonic times until which each held lease is known to be valid
+        self.handing_off = False
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Start the lease renewal loop."""
+
+        if not self.renew_leases.is_running():
+            self.renew_leases.start()
+
+    async def cog_unload(self):
+        """Release every held lease so another replica can take over immediately, unless they are being handed to a reloaded version of this cog."""
+
+        self.renew_leases.cancel()
+        if self.handing_off:
+            return
+        for lease_name in self.held:
+            release_lease(DATABASE_LEASES, lease_name, REPLICA_ID)
+        self.held.clear()
+
+    def export_state(self) -> dict:
+        self.handing_off = True
+        return {"wanted": self.wanted, "held": self.held}
+
+    async def import_state(self, state: dict):
+        """Keep holding the leases of a previous version of this cog, then restart the lease renewal loop."""
+
+        self.wanted = state["wanted"]
+        self.held = state["held"] if isinstance(state["held"], dict) else dict.fromkeys(state["held"], 0) # Versions before expiry tracking held a set
+        self.renew_leases.start()
+
+    def is_valid(self, lease_name: str) -> bool:
+        """Check whether a lease is held and has been renewed recently enough that no other replica can have taken it over."""
+
+        return self.held.get(lease_name, 0) > time.monotonic()
+
+    @tasks.loop(seconds=LEASE_DURATION / 3)
+    async def renew_leases(self):
+        """Take or renew every wanted lease, and dispatch an event whenever one is gained or lost."""
+
+        for lease_name in self.wanted.copy():
+            # The lease expires no earlier than LEASE_DURATION after the claim was sent, whatever the database's clock says
+            claimed_at = time.monotonic()
+            try:
+                is_held = await asyncio.to_thread(claim_lease, DATABASE_LEASES, lease_name, REPLICA_ID, LEASE_DURATION)
+            except Exception:
+                is_held = False # Without the database, other replicas may already be taking over this lease
+
+            if is_held:
+                was_held = lease_name in self.held
+                self.held[lease_name] = claimed_at + LEASE_DURATION - LEASE_MARGIN
+                if not was_held:
+                    self.bot.dispatch("lease_acquired", lease_name)
+            elif lease_name in self.held:
+                del self.held[lease_name]
+                self.bot.dispatch("lease_lost", lease_name)
+
+
+def want_lease(bot: commands.Bot, lease_name: str):
+    """Ask the Leases cog to compete for a lease on this replica's behalf."""
+
+    leases = bot.get_cog("Leases")
+    if leases is not None:
+        leases.wanted.add(lease_name)
+
+def holds_lease(bot: commands.Bot, lease_name: str) -> bool:
+    """Check whether this replica currently owns a lease.
+
+    Without leases enabled, a single replica owns every lease. With them enabled, no lease is owned while the Leases cog
+    is not loaded, such as during a reload or shutdown."""
+
+    leases = bot.get_cog("Leases")
+    if leases is None:
+        return not LEASES_ENABLED
+    return leases.is_valid(lease_name)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Leases(bot))
@@ -13,6 +13,15 @@ class Music(commands.Cog, name="Music"):
         self.track_context: dict[str, commands.Context] = {}
 
         self.looping: dict[int, bool] = {}
+
+    def export_state(self) -> dict:
+        return {"looping": self.looping, "track_context": self.track_context}
+
+    async def import_state(self, state: dict):
+        """Take over the looping settings and queued track contexts of a previous version of this cog."""
+
+        self.looping = state["looping"]
+        self.track_context = state["track_context"]
     
     @commands.Cog.listener()
     async def on_ready(self):
@@ -159,4 +168,8 @@ class Music(commands.Cog, name="Music"):
         
         vc: wavelink.Player = context.voice_client
         if vc:
-            await vc.disconnect()
\ No newline at end of file
+            await vc.disconnect()
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Music(bot))
@@ -1,11 +1,132 @@
+import asyncio, time
+from dataclasses import dataclass, field
+from ioutils import RandomColorEmbed
+
 import discord
 from discord.ext import commands
 
+
+POLL_EMOJIS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
+POLL_EDIT_INTERVAL = 3 # Minimum seconds between edits to the same poll message
+POLL_LIFETIME = 24 * 60 * 60 # Seconds a poll's vote counts are kept updated
+
+@dataclass
+class Poll:
+    """A poll message and the live vote counts shown on it."""
+
+    message: discord.Message
+    embed: discord.Embed
+    options: list[str]
+    voters: dict[str, set[int]] = field(default_factory=dict)
+    pending_edit: asyncio.Task = None
+    last_edit: float = 0
+    created_at: float = field(default_factory=time.monotonic)
+
+    def describe(self) -> str:
+        """List each option with its number of votes."""
+
+        return '\n'.join([f"{emoji} {option} - **{len(self.voters.get(emoji, ()))}**" for emoji, option in zip(POLL_EMOJIS, self.options)])
+
 class Polling(commands.Cog, name="Polling"):
     """Post a question with options to vote on."""
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.polls: dict[int, Poll] = {}
+
+    def export_state(self) -> dict:
+        return {"polls": self.polls}
+
+    async def import_state(self, state: dict):
+        """Take over the live polls of a previous version of this cog."""
+
+        self.polls = state["polls"]
+    
+    @commands.command()
+    async def poll(self, context: commands.Context, question: str, *options: str):
+        """Ask a question with up to 10 options, showing live vote counts. Quote the question and any options with spaces."""
+
+        if not 2 <= len(options) <= len(POLL_EMOJIS):
+            await context.send(f"Polls need between 2 and {len(POLL_EMOJIS)} options.")
+            return
+
+        self.evict_expired_polls()
+        embed = RandomColorEmbed(title=question)
+        poll = Poll(None, embed, list(options))
+        embed.description = poll.describe()
+
+        poll.message = await context.send(embed=embed)
+        poll.last_edit = time.monotonic()
+        self.polls[poll.message.id] = poll
+        for emoji in POLL_EMOJIS[:len(options)]:
+            await poll.message.add_reaction(emoji)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        """Count a vote on a poll."""
+
+        poll = self.get_poll(payload)
+        if poll is not None:
+            poll.voters.setdefault(str(payload.emoji), set()).add(payload.user_id)
+            self.schedule_edit(poll)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        """Take back a vote on a poll."""
+
+        poll = self.get_poll(payload)
+        if poll is not None:
+            poll.voters.get(str(payload.emoji), set()).discard(payload.user_id)
+            self.schedule_edit(poll)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        """Stop tracking a poll once its message is deleted."""
+
+        self.stop_tracking(payload.message_id)
+
+    def stop_tracking(self, message_id: int):
+        poll = self.polls.pop(message_id, None)
+        if poll is not None and poll.pending_edit is not None:
+            poll.pending_edit.cancel()
+
+    def evict_expired_polls(self):
+        """Stop tracking polls older than POLL_LIFETIME. Polls are stored in the order they were created, so only the oldest need checking."""
+
+        now = time.monotonic()
+        while len(self.polls) > 0:
+            message_id, poll = next(iter(self.polls.items()))
+            if now - poll.created_at < POLL_LIFETIME:
+                break
+            del self.polls[message_id] # Any pending edit still finishes with the final counts
+
+    def get_poll(self, payload: discord.RawReactionActionEvent) -> Poll:
+        """Find the poll a reaction event counts towards, if any."""
+
+        self.evict_expired_polls()
+        poll = self.polls.get(payload.message_id, None)
+        if poll is None or payload.user_id == self.bot.user.id or str(payload.emoji) not in POLL_EMOJIS[:len(poll.options)]:
+            return None
+        return poll
+
+    def schedule_edit(self, poll: Poll):
+        """Update the poll message soon, merging every vote made in the meantime into a single edit."""
+
+        if poll.pending_edit is None:
+            poll.pending_edit = asyncio.create_task(self.edit_poll(poll))
+
+    async def edit_poll(self, poll: Poll):
+        await asyncio.sleep(max(0, poll.last_edit + POLL_EDIT_INTERVAL - time.monotonic()))
+
+        poll.pending_edit = None # Votes from here on need another edit
+        poll.last_edit = time.monotonic()
+        poll.embed.description = poll.describe()
+        try:
+            await poll.message.edit(embed=poll.embed)
+        except (discord.NotFound, discord.Forbidden):
+            self.stop_tracking(poll.message.id) # The message is gone or can no longer be edited
+        except discord.HTTPException as error:
+            print(f"Failed to update poll {poll.message.id}: {error}")
     
     @commands.command()
     async def yesorno(self, context: commands.Context):
@@ -24,4 +145,8 @@ class Polling(commands.Cog, name="Polling"):
         
         choice_message = await context.send(f"What's the right thing to do?\n>>> {lightbulb} Return the sun\n{nikopensive} Return home")
         await choice_message.add_reaction(lightbulb)
-        await choice_message.add_reaction(nikopensive)
\ No newline at end of file
+        await choice_message.add_reaction(nikopensive)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Polling(bot))
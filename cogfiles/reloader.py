@@ -0,0 +1,62 @@
+import time, traceback
+
+from discord.ext import commands
+
+
+class Reloader(commands.Cog, name="Reloader"):
+    """Reload cog extensions in place, handing each cog's in-memory state to its replacement.
+
+    A cog can define export_state() to return the state it wants to keep, which is called before it is unloaded,
+    and an async import_state(state) to take that state over (and restart anything its on_ready listener would start),
+    which is called on the replacement once it is loaded. Modules the extension imports, like ioutils, are not reloaded."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @commands.command()
+    @commands.is_owner()
+    async def reload(self, context: commands.Context, extension: str):
+        """Reload a cog extension, such as reminders, without reconnecting to Discord."""
+
+        extension = extension if extension.startswith("cogfiles.") else f"cogfiles.{extension}"
+        if extension not in self.bot.extensions:
+            await context.send(f"Extension `{extension}` is not loaded.")
+            return
+
+        start = time.perf_counter()
+        old_cogs = {name: cog for name, cog in self.bot.cogs.items() if type(cog).__module__ == extension}
+        states = {name: cog.export_state() if hasattr(cog, "export_state") else {} for name, cog in old_cogs.items()}
+
+        error = None
+        try:
+            await self.bot.reload_extension(extension)
+        except commands.ExtensionError as extension_error:
+            error = extension_error # The previous version of the extension is loaded again instead
+
+        import_errors = []
+        for name, old_cog in old_cogs.items():
+            new_cog = self.bot.get_cog(name)
+            if new_cog is not None and new_cog is not old_cog and hasattr(new_cog, "import_state"):
+                try:
+                    await new_cog.import_state(states[name])
+                except Exception as import_error: # Keep handing state to the other cogs, and still report the reload
+                    print(f"Failed to hand over the state of cog {name!r}:")
+                    traceback.print_exc()
+                    import_errors.append(f"{name}: {import_error}")
+
+        elapsed = (time.perf_counter() - start) * 1000
+        if error is not None:
+            await context.send(f"Failed to reload `{extension}`, kept the previous version: {error}")
+        elif len(import_errors) > 0:
+            await context.send(f"Reloaded `{extension}` in {elapsed:.0f}ms, but some state was not handed over: {'; '.join(import_errors)}")
+        else:
+            await context.send(f"Reloaded `{extension}` in {elapsed:.0f}ms.")
+
+    @reload.error
+    async def permissions_fail(self, context: commands.Context, error: commands.errors.CommandError):
+        if isinstance(error, commands.errors.NotOwner):
+            await context.send("Only the bot owner can use this command.")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Reloader(bot))
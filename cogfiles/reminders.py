@@ -1,12 +1,16 @@
-import datetime, json, re
+import bisect, datetime, json, math, re
 from dataclasses import dataclass, field
-from ioutils import RandomColorEmbed, read_sql, write_sql, DATABASE_SETTINGS
+from ioutils import RandomColorEmbed, settings_writes
+from cogfiles.leases import holds_lease, want_lease
 
 import discord
 from discord.ext import commands, tasks
 from discord.utils import format_dt
 
 
+REMINDERS_PER_PAGE = 10
+
+
 @dataclass(frozen=True, order=True)
 class Reminder:
     """Data associated with a scheduled reminder."""
@@ -46,53 +50,244 @@ class Reminder:
 
         return Reminder(command_message, reminder_datetime, reminder_str)
 
+class ReminderStore:
+    """A server's reminders, kept ordered by scheduled time and indexed by author."""
+
+    def __init__(self, reminders: list[Reminder] = ()):
+        self._reminders: list[Reminder] = []
+        self._by_author: dict[int, list[Reminder]] = {}
+        for reminder in reminders:
+            self.add(reminder)
+        self.changed = False # Set whenever the store no longer matches the SQL database
+
+    def __len__(self):
+        return len(self._reminders)
+
+    def __iter__(self):
+        return iter(self._reminders)
+
+    def __contains__(self, reminder: Reminder):
+        return any(ReminderStore._same_reminder(other, reminder) for other in self._reminders[ReminderStore._bisect_range(self._reminders, reminder)])
+
+    def add(self, reminder: Reminder):
+        """Insert a reminder in order of its scheduled time."""
+
+        bisect.insort(self._reminders, reminder)
+        bisect.insort(self._by_author.setdefault(reminder.command_message.author.id, []), reminder)
+        self.changed = True
+
+    def remove(self, reminder: Reminder):
+        """Remove a reminder, raising a ValueError if it is not in the store."""
+
+        author_id = reminder.command_message.author.id
+        ReminderStore._remove_from(self._reminders, reminder)
+        ReminderStore._remove_from(self._by_author[author_id], reminder)
+        self.changed = True
+
+    def discard(self, reminder: Reminder):
+        """Remove a reminder if it is in the store."""
+
+        if reminder in self:
+            self.remove(reminder)
+
+    def all(self) -> list[Reminder]:
+        """Every reminder, ordered by scheduled time. The list is updated in place as the store changes."""
+
+        return self._reminders
+
+    def by_author(self, author_id: int) -> list[Reminder]:
+        """Reminders created by a single member, ordered by scheduled time. The list is updated in place as the store changes,
+        so an author's list is kept even once it is empty."""
+
+        return self._by_author.setdefault(author_id, [])
+
+    def due(self, now: datetime.datetime) -> list[Reminder]:
+        """Reminders scheduled at or before the given time."""
+
+        return self._reminders[:bisect.bisect_right(self._reminders, now, key=lambda reminder: reminder.reminder_datetime)]
+
+    @staticmethod
+    def _bisect_range(reminders: list[Reminder], reminder: Reminder) -> slice:
+        # Search by scheduled time rather than comparing reminders, since reminders created before a reload belong to an older class
+        get_datetime = lambda reminder: reminder.reminder_datetime
+        return slice(bisect.bisect_left(reminders, reminder.reminder_datetime, key=get_datetime), bisect.bisect_right(reminders, reminder.reminder_datetime, key=get_datetime))
+
+    @staticmethod
+    def _remove_from(reminders: list[Reminder], reminder: Reminder):
+        positions = ReminderStore._bisect_range(reminders, reminder)
+        for i in range(positions.start, positions.stop):
+            if ReminderStore._same_reminder(reminders[i], reminder):
+                del reminders[i]
+                return
+        raise ValueError(f"{reminder!r} is not in the reminder store")
+
+    @staticmethod
+    def _same_reminder(reminder: Reminder, other: Reminder) -> bool:
+        # Match by command message and time rather than identity, since a reminder may be rebuilt by a reloaded cog or read from the SQL database again
+        return reminder.command_message.id == other.command_message.id and reminder.reminder_datetime == other.reminder_datetime
+
+class ReminderPageView(discord.ui.View):
+    """Page through a list of reminders with buttons, only rendering the reminders on the current page."""
+
+    def __init__(self, context: commands.Context, reminders: list[Reminder]):
+        super().__init__()
+        self.member = context.author
+        self.reminders = reminders
+        self.page = 0
+        self.update_items()
+
+    @property
+    def page_count(self) -> int:
+        return max(1, math.ceil(len(self.reminders) / REMINDERS_PER_PAGE))
+
+    def page_reminders(self) -> list[Reminder]:
+        start = self.page * REMINDERS_PER_PAGE
+        return self.reminders[start:start + REMINDERS_PER_PAGE]
+
+    def embed(self) -> RandomColorEmbed:
+        """Create an embed listing the reminders on the current page."""
+
+        start = self.page * REMINDERS_PER_PAGE
+        reminder_list = RandomColorEmbed(
+            title="Scheduled Reminders",
+            description='\n'.join([f"{start+i+1}. {reminder}" for i, reminder in enumerate(self.page_reminders())]) or "No reminders currently set."
+        )
+        reminder_list.set_footer(text=f"Page {self.page+1}/{self.page_count}")
+        return reminder_list
+
+    def update_items(self):
+        """Keep the current page in range and enable only the buttons that lead somewhere."""
+
+        self.page = min(self.page, self.page_count - 1)
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page == self.page_count - 1
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        self.update_items()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        self.update_items()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        return interaction.user == self.member
+
 class ReminderCancelSelect(discord.ui.Select):
-    def __init__(self, context: commands.Context, reminders: set[Reminder]):
-        self.bot = context.bot
+    def __init__(self, reminders: list[Reminder]):
         self.reminders = reminders
 
-        options = [discord.SelectOption(label=repr(reminder)) for reminder in sorted(reminders)]
+        options = [discord.SelectOption(label=repr(reminder), value=str(i)) for i, reminder in enumerate(reminders)]
         super().__init__(placeholder="Select reminders to cancel...", max_values=len(reminders), options=options)
     
     async def callback(self, interaction: discord.Interaction):
-        cancelled_reminders = {reminder for reminder in self.reminders if repr(reminder) in self.values}
-        self.bot.get_cog("Reminders").reminders[interaction.guild_id] -= cancelled_reminders
+        cancelled_reminders = [self.reminders[int(value)] for value in self.values]
+        store = interaction.client.get_cog("Reminders").reminders[interaction.guild_id]
+        for reminder in cancelled_reminders:
+            store.discard(reminder)
+
+        self.view.update_items()
+        await interaction.response.edit_message(embed=self.view.embed(), view=self.view)
 
         cancelled_reminder_list = RandomColorEmbed(
             title="Cancelled Reminders",
-            description='\n'.join([str(reminder) for reminder in sorted(cancelled_reminders)])
+            description='\n'.join([str(reminder) for reminder in cancelled_reminders])
         )
-        await interaction.response.send_message(embed=cancelled_reminder_list, ephemeral=True)
+        await interaction.followup.send(embed=cancelled_reminder_list, ephemeral=True)
 
-class ReminderCancelView(discord.ui.View):
-    def __init__(self, context: commands.Context, reminders: set[Reminder]):
-        super().__init__()
-        self.member = context.author
-        self.add_item(ReminderCancelSelect(context, reminders))
-    
-    async def interaction_check(self, interaction: discord.Interaction):
-        return interaction.user == self.member
+class ReminderCancelView(ReminderPageView):
+    def update_items(self):
+        """Offer the reminders on the current page as select options, since Discord allows at most 25 of them."""
+
+        super().update_items()
+        for item in self.children:
+            if isinstance(item, ReminderCancelSelect):
+                self.remove_item(item)
+        if len(self.page_reminders()) > 0:
+            self.add_item(ReminderCancelSelect(self.page_reminders()))
 
 class Reminders(commands.Cog, name="Reminders"):
     """Create and send scheduled reminder messages."""
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.reminders: dict[int, set[Reminder]] = {}
-        self._cached_reminders: dict[int, set[Reminder]] = {}
+        self.reminders: dict[int, ReminderStore] = {}
     
     @commands.Cog.listener()
     async def on_ready(self):
         """Initialize the reminders instance dictionary from SQL data and start the reminder processing loop."""
 
         for guild in self.bot.guilds:
-            if read_sql(DATABASE_SETTINGS, guild.id, "reminders") is None:
-                write_sql(DATABASE_SETTINGS, guild.id, "reminders", "array[[]]::json[]")
-            self.reminders[guild.id] = {await Reminder.from_json(self.bot, json_str) for json_str in read_sql(DATABASE_SETTINGS, guild.id, "reminders")}
-            self._cached_reminders[guild.id] = self.reminders[guild.id].copy()
+            self.reminders[guild.id] = ReminderStore()
+            want_lease(self.bot, Reminders.lease_name(guild.id))
+            if holds_lease(self.bot, Reminders.lease_name(guild.id)):
+                await self.load_reminders(guild.id)
         
         self.send_reminders.start()
         self.sync_sql.start()
+
+    async def cog_unload(self):
+        """Let the reminder loops finish their current iteration, so no reminder is sent twice after a reload."""
+
+        for loop in self.send_reminders, self.sync_sql:
+            loop.stop()
+            if loop.get_task() is not None:
+                await loop.get_task()
+
+    def export_state(self) -> dict:
+        return {"reminders": self.reminders}
+
+    async def import_state(self, state: dict):
+        """Take over the reminders of a previous version of this cog, then restart the reminder loops."""
+
+        for guild_id, old_store in state["reminders"].items():
+            self.reminders[guild_id] = ReminderStore([Reminder(reminder.command_message, reminder.reminder_datetime, reminder.reminder_str) for reminder in old_store])
+            self.reminders[guild_id].changed = old_store.changed
+
+        self.send_reminders.start()
+        self.sync_sql.start()
+
+    @commands.Cog.listener()
+    async def on_lease_acquired(self, lease_name: str):
+        """Take over a server's reminders from the SQL database once this replica becomes their owner."""
+
+        if lease_name.startswith("reminders:"):
+            await self.load_reminders(int(lease_name.removeprefix("reminders:")))
+
+    @commands.Cog.listener()
+    async def on_lease_lost(self, lease_name: str):
+        """Forget a server's reminders once another replica owns them, so only reminders made from now on are merged back in later.
+        An unflushed write of them is dropped too, since flushing it later would overwrite the new owner's reminders."""
+
+        if lease_name.startswith("reminders:"):
+            guild_id = int(lease_name.removeprefix("reminders:"))
+            self.reminders[guild_id] = ReminderStore()
+            settings_writes.discard(guild_id, "reminders")
+
+    async def load_reminders(self, guild_id: int):
+        """Load a server's reminders from the SQL database, keeping any reminders made while this replica did not own them."""
+
+        guild_reminders = settings_writes.read(guild_id, "reminders")
+        if guild_reminders is None:
+            guild_reminders = []
+            settings_writes.write(guild_id, "reminders", guild_reminders)
+        store = ReminderStore([await Reminder.from_json(self.bot, json_str) for json_str in guild_reminders])
+
+        stored_message_ids = {reminder.command_message.id for reminder in store}
+        for reminder in self.reminders.get(guild_id, ()):
+            if reminder.command_message.id not in stored_message_ids:
+                store.add(reminder) # Marks the store as changed, so the merged reminders are synced
+        self.reminders[guild_id] = store
+
+    @staticmethod
+    def lease_name(guild_id: int) -> str:
+        """Name of the lease deciding which replica sends and stores a server's reminders."""
+
+        return f"reminders:{guild_id}"
  
     @commands.group(aliases=["remindme", "rm"], invoke_without_command=True)
     async def remind(self, context: commands.Context, time: str, *, reminder_str: str = ""):
@@ -112,7 +307,7 @@ class Reminders(commands.Cog, name="Reminders"):
         reminder = Reminder(context.message, reminder_datetime, reminder_str)
         
         if context.guild.id not in self.reminders:
-            self.reminders[context.guild.id] = set()
+            self.reminders[context.guild.id] = ReminderStore()
         self.reminders[context.guild.id].add(reminder)
         
         await context.message.add_reaction("👍")
@@ -138,50 +333,56 @@ class Reminders(commands.Cog, name="Reminders"):
             await context.send("No reminders currently set.")
             return
 
-        reminder_list = RandomColorEmbed(
-            title="Scheduled Reminders",
-            description='\n'.join([f"{i+1}. {reminder}" for i, reminder in enumerate(sorted(self.reminders[context.guild.id]))])
-        )
-        await context.send(embed=reminder_list)
+        view = ReminderPageView(context, self.reminders[context.guild.id].all())
+        await context.send(embed=view.embed(), view=view)
 
     @remind.command()
     async def cancel(self, context: commands.Context):
         """Cancel scheduled reminders."""
         
-        is_viewable = lambda reminder: context.author.guild_permissions.manage_guild or reminder.command_message.author == context.author
-        filtered_reminders = {reminder for reminder in self.reminders[context.guild.id] if is_viewable(reminder)}
+        if context.author.guild_permissions.manage_guild:
+            filtered_reminders = self.reminders[context.guild.id].all()
+        else:
+            filtered_reminders = self.reminders[context.guild.id].by_author(context.author.id)
         
         if len(filtered_reminders) == 0:
             await context.send("No reminders currently set.")
             return
 
-        await context.send(view=ReminderCancelView(context, filtered_reminders))
+        view = ReminderCancelView(context, filtered_reminders)
+        await context.send(embed=view.embed(), view=view)
     
     @tasks.loop(seconds=0.2)
     async def send_reminders(self):
         """Send any reminders past their scheduled date."""
 
         for guild in self.bot.guilds:
-            reminders = self.reminders[guild.id].copy()
-            for reminder in reminders:
-                if reminder.reminder_datetime <= datetime.datetime.now():
-                    # Read the list of reactions to the message, and create a string to mention each user (besides the bot) who reacted
-                    for reaction in reminder.command_message.reactions:
-                        if reaction.emoji == "👍":
-                            subscribers = [user async for user in reaction.users()]
-                            subscribers_mention = "\n"
-                            for user in subscribers:
-                                if user != self.bot.user:
-                                    subscribers_mention += user.mention + " "
-
-                    await reminder.command_message.reply(f"{reminder.reminder_str} {subscribers_mention}")
-                    self.reminders[guild.id].remove(reminder)
+            if not holds_lease(self.bot, Reminders.lease_name(guild.id)):
+                continue
+            for reminder in self.reminders[guild.id].due(datetime.datetime.now()):
+                # Read the list of reactions to the message, and create a string to mention each user (besides the bot) who reacted
+                for reaction in reminder.command_message.reactions:
+                    if reaction.emoji == "👍":
+                        subscribers = [user async for user in reaction.users()]
+                        subscribers_mention = "\n"
+                        for user in subscribers:
+                            if user != self.bot.user:
+                                subscribers_mention += user.mention + " "
+
+                await reminder.command_message.reply(f"{reminder.reminder_str} {subscribers_mention}")
+                self.reminders[guild.id].discard(reminder)
     
     @tasks.loop(seconds=0.3)
     async def sync_sql(self):
         """Sync with the SQL database if any changes are detected."""
 
         for guild in self.bot.guilds:
-            if self.reminders[guild.id] != self._cached_reminders[guild.id]:
-                write_sql(DATABASE_SETTINGS, guild.id, "reminders", [reminder.to_json() for reminder in self.reminders[guild.id]])
-                self._cached_reminders[guild.id] = self.reminders[guild.id].copy()
\ No newline at end of file
+            if not holds_lease(self.bot, Reminders.lease_name(guild.id)):
+                continue
+            if self.reminders[guild.id].changed:
+                settings_writes.write(guild.id, "reminders", [reminder.to_json() for reminder in self.reminders[guild.id]])
+                self.reminders[guild.id].changed = False
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Reminders(bot))
@@ -0,0 +1,126 @@
+import asyncio, collections, sys, time
+from typing import Any, Awaitable, Callable
+from ioutils import RandomColorEmbed, current_handler, get_handler_name
+
+import discord
+from discord.ext import commands
+
+
+RESOLVER_CACHE_TTL = 300 # Seconds a fetched entity is reused before it is fetched again
+RESOLVER_CACHE_SIZE = 1000
+
+class Resolver(commands.Cog, name="Resolver"):
+    """Look up channels, users and members from the gateway cache first, and only fall back to the REST API when needed."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.cache: collections.OrderedDict[tuple, tuple[float, Any]] = collections.OrderedDict()
+        self.in_flight: dict[tuple, asyncio.Future] = {}
+        self.rest_calls: collections.Counter[str] = collections.Counter()
+        self.rest_calls_avoided: collections.Counter[str] = collections.Counter()
+
+    def export_state(self) -> dict:
+        return {"cache": self.cache, "rest_calls": self.rest_calls, "rest_calls_avoided": self.rest_calls_avoided}
+
+    async def import_state(self, state: dict):
+        """Take over the cached entities and lookup counts of a previous version of this cog."""
+
+        self.cache = state["cache"]
+        self.rest_calls = state["rest_calls"]
+        self.rest_calls_avoided = state["rest_calls_avoided"]
+
+    async def fetch_channel(self, caller: commands.Cog, channel_id: int) -> discord.abc.GuildChannel | discord.Thread | discord.abc.PrivateChannel:
+        return await self.resolve(caller, ("channel", channel_id), lambda: self.bot.get_channel(channel_id), lambda: self.bot.fetch_channel(channel_id))
+
+    async def fetch_user(self, caller: commands.Cog, user_id: int) -> discord.User:
+        return await self.resolve(caller, ("user", user_id), lambda: self.bot.get_user(user_id), lambda: self.bot.fetch_user(user_id))
+
+    async def fetch_member(self, caller: commands.Cog, guild: discord.Guild, member_id: int) -> discord.Member:
+        return await self.resolve(caller, ("member", guild.id, member_id), lambda: guild.get_member(member_id), lambda: guild.fetch_member(member_id))
+
+    async def resolve(self, caller: commands.Cog, key: tuple, get_cached: Callable[[], Any], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Find an entity in the gateway cache, then in recently fetched entities, and only then fetch it over REST.
+        Concurrent lookups of the same entity share a single request."""
+
+        cog_name = caller.qualified_name
+
+        entity = get_cached()
+        if entity is None and key in self.cache:
+            expires_at, entity = self.cache[key]
+            if expires_at > time.monotonic():
+                self.cache.move_to_end(key)
+            else:
+                del self.cache[key]
+                entity = None
+        if entity is not None:
+            self.rest_calls_avoided[cog_name] += 1
+            return entity
+
+        request = self.in_flight.get(key, None)
+        if request is None:
+            self.rest_calls[cog_name] += 1
+            # The request runs in its own task, which copies this context, so REST accounting can blame the calling handler
+            token = current_handler.set(current_handler.get() or get_handler_name(sys._getframe()))
+            try:
+                request = asyncio.ensure_future(self.fetch_and_cache(key, fetch))
+            finally:
+                current_handler.reset(token)
+            self.in_flight[key] = request
+            request.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.rest_calls_avoided[cog_name] += 1
+        return await asyncio.shield(request) # One cancelled caller should not cancel the request for the others
+
+    async def fetch_and_cache(self, key: tuple, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        entity = await fetch()
+        self.cache[key] = time.monotonic() + RESOLVER_CACHE_TTL, entity
+        self.cache.move_to_end(key)
+        while len(self.cache) > RESOLVER_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return entity
+
+    @commands.command()
+    @commands.is_owner()
+    async def resolver(self, context: commands.Context):
+        """Show how many REST calls each cog has made and avoided through the resolver."""
+
+        cog_names = sorted(self.rest_calls.keys() | self.rest_calls_avoided.keys(), key=lambda cog_name: self.rest_calls_avoided[cog_name], reverse=True)
+        resolver_stats = RandomColorEmbed(
+            title="Resolver",
+            description='\n'.join([f"**{cog_name}**: {self.rest_calls_avoided[cog_name]} REST calls avoided, {self.rest_calls[cog_name]} made" for cog_name in cog_names]) or "No lookups yet."
+        )
+        await context.send(embed=resolver_stats)
+
+    @resolver.error
+    async def permissions_fail(self, context: commands.Context, error: commands.errors.CommandError):
+        if isinstance(error, commands.errors.NotOwner):
+            await context.send("Only the bot owner can use this command.")
+
+
+async def resolve_channel(bot: commands.Bot, caller: commands.Cog, channel_id: int) -> discord.abc.GuildChannel | discord.Thread | discord.abc.PrivateChannel:
+    """Look up a channel through the Resolver cog. Without it, check the gateway cache and then fetch the channel directly."""
+
+    resolver = bot.get_cog("Resolver")
+    if resolver is not None:
+        return await resolver.fetch_channel(caller, channel_id)
+    return bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+
+async def resolve_user(bot: commands.Bot, caller: commands.Cog, user_id: int) -> discord.User:
+    """Look up a user through the Resolver cog. Without it, check the gateway cache and then fetch the user directly."""
+
+    resolver = bot.get_cog("Resolver")
+    if resolver is not None:
+        return await resolver.fetch_user(caller, user_id)
+    return bot.get_user(user_id) or await bot.fetch_user(user_id)
+
+async def resolve_member(bot: commands.Bot, caller: commands.Cog, guild: discord.Guild, member_id: int) -> discord.Member:
+    """Look up a server member through the Resolver cog. Without it, check the gateway cache and then fetch the member directly."""
+
+    resolver = bot.get_cog("Resolver")
+    if resolver is not None:
+        return await resolver.fetch_member(caller, guild, member_id)
+    return guild.get_member(member_id) or await guild.fetch_member(member_id)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Resolver(bot))
@@ -0,0 +1,118 @@
+import collections, contextvars, logging, re, sys, time
+from dataclasses import dataclass
+from ioutils import RandomColorEmbed, current_handler, get_handler_name
+
+import discord
+from discord.ext import commands
+
+
+REST_HISTORY_SIZE = 20000 # Most recent REST requests kept for reports
+
+@dataclass
+class RestRequest:
+    """A single request made to the Discord REST API."""
+
+    timestamp: float
+    handler: str
+    route: str
+    bucket: str
+    latency: float = 0
+    retry_after: float = 0
+    rate_limits: int = 0
+
+current_request: contextvars.ContextVar[RestRequest] = contextvars.ContextVar("current_request", default=None)
+
+class RateLimitHandler(logging.Handler):
+    """Attach the retry delays that discord.py logs for 429 responses to the request being made.
+
+    Only the message logged for every retried 429 is counted, since a global rate limit logs a second message for the same
+    response. 429s that are not retried raise RateLimited instead, which RestAccounting.request records."""
+
+    def emit(self, record: logging.LogRecord):
+        request = current_request.get()
+        match = re.search(r"responded with 429\. Retrying in ([\d.]+) seconds", record.getMessage())
+        if request is not None and match is not None:
+            request.rate_limits += 1
+            request.retry_after += float(match.group(1))
+
+class RestAccounting(commands.Cog, name="REST Accounting"):
+    """Record which cog handler made each Discord REST request, to find where rate limits are being spent."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.requests: collections.deque[RestRequest] = collections.deque(maxlen=REST_HISTORY_SIZE)
+        self._rate_limit_handler = RateLimitHandler()
+        self._original_request = None
+
+    def export_state(self) -> dict:
+        return {"requests": self.requests}
+
+    async def import_state(self, state: dict):
+        """Take over the request history of a previous version of this cog."""
+
+        self.requests = state["requests"]
+
+    async def cog_load(self):
+        """Wrap the bot's HTTP client so every request is recorded."""
+
+        self._original_request = self.bot.http.request
+        self.bot.http.request = self.request
+        logging.getLogger("discord.http").addHandler(self._rate_limit_handler)
+
+    async def cog_unload(self):
+        del self.bot.http.request # Fall back to the HTTP client's own method
+        logging.getLogger("discord.http").removeHandler(self._rate_limit_handler)
+
+    async def request(self, route, **kwargs):
+        route_name = f"{route.method} {route.path}"
+        bucket = getattr(self.bot.http, "_bucket_hashes", {}).get(route.key, route.key)
+        handler = current_handler.get() or get_handler_name(sys._getframe(1))
+        request = RestRequest(time.time(), handler, route_name, bucket)
+        self.requests.append(request)
+
+        token = current_request.set(request)
+        start = time.monotonic()
+        try:
+            return await self._original_request(route, **kwargs)
+        except discord.RateLimited as error:
+            request.rate_limits += 1
+            request.retry_after += error.retry_after
+            raise
+        finally:
+            request.latency = time.monotonic() - start
+            current_request.reset(token)
+
+    @commands.command()
+    @commands.is_owner()
+    async def restreport(self, context: commands.Context, minutes: int = 60):
+        """Rank the handlers and routes that made the most REST requests in the last given number of minutes."""
+
+        since = time.time() - minutes * 60
+        totals: dict[tuple[str, str, str], list[float]] = {}
+        for request in self.requests:
+            if request.timestamp >= since:
+                total = totals.setdefault((request.handler, request.route, request.bucket), [0, 0, 0, 0])
+                total[0] += 1
+                total[1] += request.latency
+                total[2] += request.rate_limits
+                total[3] += request.retry_after
+
+        ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)[:15]
+        report = RandomColorEmbed(
+            title=f"REST Requests (last {minutes} minutes)",
+            description='\n'.join([
+                f"{i+1}. **{handler}** `{route}`" + (f" (bucket `{bucket}`)" if bucket != route else "") + f": {count} calls, {latency / count * 1000:.0f}ms avg"
+                + (f", {rate_limits} 429s ({retry_after:.1f}s retry)" if rate_limits > 0 else "")
+                for i, ((handler, route, bucket), (count, latency, rate_limits, retry_after)) in enumerate(ranked)
+            ]) or "No REST requests made."
+        )
+        await context.send(embed=report)
+
+    @restreport.error
+    async def permissions_fail(self, context: commands.Context, error: commands.errors.CommandError):
+        if isinstance(error, commands.errors.NotOwner):
+            await context.send("Only the bot owner can use this command.")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(RestAccounting(bot))
@@ -10,6 +10,14 @@ class StreamPause(commands.Cog, name="Stream Pause"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.streampause_data: dict[str, discord.Message | discord.Member] = None
+
+    def export_state(self) -> dict:
+        return {"streampause_data": self.streampause_data}
+
+    async def import_state(self, state: dict):
+        """Take over the streampause in progress in a previous version of this cog."""
+
+        self.streampause_data = state["streampause_data"]
     
     @commands.Cog.listener()
     async def on_reaction_add(self, reaction: discord.Reaction, user: discord.Member):
@@ -59,4 +67,8 @@ class StreamPause(commands.Cog, name="Stream Pause"):
             await reaction.message.channel.send(f"{original_author.mention} Everyone's here!")
 
             await reaction.message.delete()
-            self.streampause_data = None
\ No newline at end of file
+            self.streampause_data = None
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(StreamPause(bot))
@@ -1,4 +1,4 @@
-import aiohttp, re
+import aiohttp, asyncio, contextlib, os, re, sys, time, traceback, urllib.parse
 from bs4 import BeautifulSoup
 from ioutils import RandomColorEmbed
 from howlongtobeatpy import HowLongToBeat
@@ -6,17 +6,94 @@ from howlongtobeatpy import HowLongToBeat
 from discord.ext import commands
 
 
+HEADYVERSION_URL = os.getenv("HEADYVERSION_URL", default="http://headyversion.com")
+HOWLONGTOBEAT_URL = "https://howlongtobeat.com"
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=20, sock_connect=5, sock_read=10) # Seconds
+
+class HostUnavailableError(Exception):
+    """Raised instead of sending a request to a host that is failing or already has too many requests waiting."""
+
+class HostPolicy:
+    """Limit concurrent requests to a single host, and fail fast for a while after repeated request failures."""
+
+    def __init__(self, host: str, max_concurrency: int = 4, queue_timeout: float = 5, failure_threshold: int = 3, reset_timeout: float = 60):
+        self.host = host
+        self.queue_timeout = queue_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.failures = 0
+        self.opened_at: float = None
+        self.trial_in_progress = False
+
+    @property
+    def state(self) -> str:
+        """Either closed while requests are allowed, open while failing fast, or half-open once a single trial request may be sent."""
+
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    @contextlib.asynccontextmanager
+    async def request(self):
+        """Wait for a free request slot, and record whether the requests made inside succeeded."""
+
+        state = self.state
+        if state == "open" or (state == "half-open" and self.trial_in_progress):
+            raise HostUnavailableError(f"Requests to {self.host} are failing")
+        is_trial = state == "half-open"
+        if is_trial:
+            self.trial_in_progress = True
+
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if is_trial:
+                self.trial_in_progress = False
+            raise HostUnavailableError(f"Too many requests to {self.host} are waiting")
+
+        self.in_flight += 1
+        try:
+            yield
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.failures += 1
+            if is_trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            raise
+        else:
+            self.failures = 0
+            self.opened_at = None
+        finally:
+            self.in_flight -= 1
+            if is_trial:
+                self.trial_in_progress = False
+            self.semaphore.release()
+
+
 class WebScrapers(commands.Cog, name="Web Scrapers"):
     """Grab data from various websites and send it."""
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.hosts: dict[str, HostPolicy] = {}
+
+    def export_state(self) -> dict:
+        return {"hosts": self.hosts}
+
+    async def import_state(self, state: dict):
+        """Take over the request policies of a previous version of this cog, keeping any open circuits open."""
+
+        self.hosts = state["hosts"]
 
     @commands.group(aliases=["hltb"], invoke_without_command=True)
     async def howlongtobeat(self, context: commands.Context, *, game_name: str):
         """Search HowLongToBeat with the given game name and show completion time info."""
         
-        game_list = await WebScrapers.hltb_search(game_name)
+        game_list = await self.hltb_search(game_name)
         if game_list is None:
             await context.send("Could not find a game with that title.")
             return
@@ -39,7 +116,7 @@ class WebScrapers(commands.Cog, name="Web Scrapers"):
     async def search(self, context: commands.Context, *, game_name: str):
         """Search HowLongToBeat with the given game name and show at most the first 10 results."""
 
-        game_list = await WebScrapers.hltb_search(game_name)
+        game_list = await self.hltb_search(game_name)
         if game_list is None:
             await context.send("Could not find a game with that title.")
             return
@@ -52,10 +129,13 @@ class WebScrapers(commands.Cog, name="Web Scrapers"):
 
         await context.send(embed=game_list_data)
 
-    @staticmethod
-    async def hltb_search(game_name: str):
-        results_list = await HowLongToBeat().async_search(game_name, similarity_case_sensitive=False)
-        if results_list is None or len(results_list) == 0:
+    async def hltb_search(self, game_name: str):
+        # The HowLongToBeat client creates its own session, so only a total deadline can be applied
+        async with self.host_policy(HOWLONGTOBEAT_URL).request():
+            results_list = await asyncio.wait_for(HowLongToBeat().async_search(game_name, similarity_case_sensitive=False), REQUEST_TIMEOUT.total)
+            if results_list is None: # The client hides error responses, while a search with no matches is an empty list
+                raise aiohttp.ClientError("HowLongToBeat did not answer the search")
+        if len(results_list) == 0:
             return None
         
         return sorted(results_list, key=lambda element: element.similarity, reverse=True)
@@ -64,41 +144,89 @@ class WebScrapers(commands.Cog, name="Web Scrapers"):
     async def heady(self, context: commands.Context, *, song_name: str):
         """Search HeadyVersion with the given song name."""
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get("http://headyversion.com/search/") as response:
-                token = response.cookies["csrftoken"].value
-            async with session.post("http://headyversion.com/search/", data={"title": song_name, "csrfmiddlewaretoken": token}) as response:
-                content = await response.read()
+        result = await self.heady_search(song_name)
+        if result is None:
+            await context.send("Could not find a song with that title.")
+            return
+
+        title, url, description = result
+        embed = RandomColorEmbed(title=title, url=url, description=description)
+        embed.set_thumbnail(url="https://clipartspub.com/images/grateful-dead-clipart-template-5.png")
+        await context.send(embed=embed)
+
+    async def heady_search(self, song_name: str) -> tuple[str, str, str]:
+        """Scrape the title, link and top 5 shows of the HeadyVersion page for the given song name."""
+
+        async with self.host_policy(HEADYVERSION_URL).request():
+            async with aiohttp.ClientSession(timeout=REQUEST_TIMEOUT, raise_for_status=True) as session:
+                async with session.get(f"{HEADYVERSION_URL}/search/") as response:
+                    token = response.cookies["csrftoken"].value
+                async with session.post(f"{HEADYVERSION_URL}/search/", data={"title": song_name, "csrfmiddlewaretoken": token}) as response:
+                    content = await response.read()
+                    url = str(response.url)
                 soup = BeautifulSoup(content, "html.parser")
 
-                if str(response.url) == "http://headyversion.com/search/":
+                if url == f"{HEADYVERSION_URL}/search/":
                     table = soup.find("table")
                     if table is None:
-                        await context.send("Could not find a song with that title.")
-                        return
-                    else:
-                        songs = table.find_all("div", class_ = "big_link")
-                        song_link = songs[0].find("a").get("href")
-                        async with session.get(f"http://headyversion.com{song_link}") as response:
-                            content = await response.read()
-                            soup = BeautifulSoup(content, "html.parser")
-
-                title = "HeadyVersion: " + re.search(r"Grateful Dead best (.+) \| headyversion", soup.find("title").string).group(1)
-                description = ""
-
-                for show in list(soup.find_all("div", class_="row s2s_submission bottom_border"))[:5]:
-                    votes = re.search(r"(\d+)", show.find("div", class_="score").string).group(1)
-                    
-                    show_details = show.find("div", class_="show_details_info")
-                    show_date = show_details.find("div", class_="show_date")
-                    show_heady_link = f"http://headyversion.com{show_details.find('a').get('href')}"
-                    show_archive_link = f"http://headyversion.com{show.find('div', class_='show_links').find('a', target='_blank').get('href')}"
-
-                    for stripped_show_date in show_date.stripped_strings:
-                        field_name = f"**{stripped_show_date}** \n{votes} votes"
-                        field_value = f"[HeadyVersion Link]({show_heady_link}) | [Archive.org Link]({show_archive_link})\n\n"
-                        description += f"{field_name}\n {field_value}"
-
-                embed = RandomColorEmbed(title=title, url=response.url, description=description)
-                embed.set_thumbnail(url="https://clipartspub.com/images/grateful-dead-clipart-template-5.png")
-                await context.send(embed=embed)
\ No newline at end of file
+                        return None
+                    songs = table.find_all("div", class_ = "big_link")
+                    song_link = songs[0].find("a").get("href")
+                    async with session.get(f"{HEADYVERSION_URL}{song_link}") as response:
+                        content = await response.read()
+                        url = str(response.url)
+                    soup = BeautifulSoup(content, "html.parser")
+
+        title = "HeadyVersion: " + re.search(r"Grateful Dead best (.+) \| headyversion", soup.find("title").string).group(1)
+        description = ""
+
+        for show in list(soup.find_all("div", class_="row s2s_submission bottom_border"))[:5]:
+            votes = re.search(r"(\d+)", show.find("div", class_="score").string).group(1)
+            
+            show_details = show.find("div", class_="show_details_info")
+            show_date = show_details.find("div", class_="show_date")
+            show_heady_link = f"{HEADYVERSION_URL}{show_details.find('a').get('href')}"
+            show_archive_link = f"{HEADYVERSION_URL}{show.find('div', class_='show_links').find('a', target='_blank').get('href')}"
+
+            for stripped_show_date in show_date.stripped_strings:
+                field_name = f"**{stripped_show_date}** \n{votes} votes"
+                field_value = f"[HeadyVersion Link]({show_heady_link}) | [Archive.org Link]({show_archive_link})\n\n"
+                description += f"{field_name}\n {field_value}"
+
+        return title, url, description
+
+    def host_policy(self, url: str) -> HostPolicy:
+        """Get the shared request policy for the host of a URL."""
+
+        host = urllib.parse.urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = HostPolicy(host)
+        return self.hosts[host]
+
+    @commands.command()
+    async def scrapers(self, context: commands.Context):
+        """Show the state of requests to each website the scrapers use."""
+
+        if len(self.hosts) == 0:
+            await context.send("No websites have been scraped yet.")
+            return
+
+        host_list = RandomColorEmbed(
+            title="Web Scrapers",
+            description='\n'.join([f"**{host}**: {policy.state}, {policy.in_flight} in flight, {policy.failures} consecutive failures" for host, policy in self.hosts.items()])
+        )
+        await context.send(embed=host_list)
+
+    @howlongtobeat.error
+    @search.error
+    @heady.error
+    async def request_fail(self, context: commands.Context, error: commands.errors.CommandError):
+        if isinstance(error, commands.errors.CommandInvokeError) and isinstance(error.original, (HostUnavailableError, aiohttp.ClientError, asyncio.TimeoutError)):
+            await context.send("That website is not responding right now. Try again later.")
+        else:
+            print(f"Ignoring exception in command {context.command}:", file=sys.stderr)
+            traceback.print_exception(error)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(WebScrapers(bot))
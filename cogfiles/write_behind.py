@@ -0,0 +1,67 @@
+import asyncio, signal
+from ioutils import settings_writes
+
+from discord.ext import commands, tasks
+
+
+FLUSH_INTERVAL = 2 # Seconds between flushes of buffered settings writes
+UNLOAD_FLUSH_ATTEMPTS = 3
+UNLOAD_RETRY_DELAY = 1 # Seconds between attempts to flush when unloading
+
+class WriteBehind(commands.Cog, name="Write Behind"):
+    """Batch settings writes in memory and flush them to the SQL database together."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def cog_load(self):
+        settings_writes.enabled = True
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await self.start_flushing()
+
+    async def import_state(self, state: dict):
+        """Resume flushing after this cog is reloaded."""
+
+        await self.start_flushing()
+
+    async def start_flushing(self):
+        """Start flushing buffered writes, and close the bot cleanly on SIGTERM so the buffer is flushed on shutdown."""
+
+        if self.flush_writes.is_running():
+            return
+
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.bot.close()))
+        except NotImplementedError:
+            pass # Signal handlers are not supported on Windows event loops
+        self.flush_writes.start()
+
+    async def cog_unload(self):
+        """Flush every remaining write, then go back to writing immediately.
+
+        Writes that still cannot be flushed stay pending for the next time this cog is loaded. Until then, writing a cell
+        directly discards its pending write."""
+
+        self.flush_writes.cancel()
+        for attempt in range(1, UNLOAD_FLUSH_ATTEMPTS + 1):
+            try:
+                settings_writes.flush()
+                break
+            except Exception as error:
+                print(f"Failed to flush {len(settings_writes.pending)} settings writes on unload (attempt {attempt}/{UNLOAD_FLUSH_ATTEMPTS}): {error}")
+                if attempt < UNLOAD_FLUSH_ATTEMPTS:
+                    await asyncio.sleep(UNLOAD_RETRY_DELAY)
+        settings_writes.enabled = False
+
+    @tasks.loop(seconds=FLUSH_INTERVAL)
+    async def flush_writes(self):
+        try:
+            settings_writes.flush()
+        except Exception as error:
+            print(f"Failed to flush {len(settings_writes.pending)} settings writes, retrying: {error}")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(WriteBehind(bot))
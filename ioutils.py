@@ -1,19 +1,48 @@
-import json, os, psycopg2, psycopg2.extensions, psycopg2.extras
+import contextvars, json, os, psycopg2, psycopg2.extensions, psycopg2.extras, socket
 from discord import Embed, Color
 
 
 DATABASE_SETTINGS = os.getenv("DATABASE_SETTINGS", default="test_settings")
+DATABASE_LEASES = os.getenv("DATABASE_LEASES", default="test_leases")
+DATABASE_SSLMODE = os.getenv("DATABASE_SSLMODE", default="require") # Set to "disable" for a local database without SSL
+REPLICA_ID = os.getenv("REPLICA_ID", default=f"{socket.gethostname()}:{os.getpid()}")
+COGFILES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cogfiles")
 psycopg2.extensions.register_adapter(dict, psycopg2.extras.Json)
 
 class RandomColorEmbed(Embed):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, color=Color.random(), **kwargs)
 
+# The cog handler that work is being done for, when it is done in a task the handler does not appear on the stack of
+current_handler: contextvars.ContextVar[str] = contextvars.ContextVar("current_handler", default=None)
+
+def get_handler_name(frame) -> str:
+    """Name the outermost cog method on a stack, or the innermost function if no cog is involved."""
+
+    handler = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+    while frame is not None:
+        if os.path.dirname(os.path.abspath(frame.f_code.co_filename)) == COGFILES_DIRECTORY:
+            instance = frame.f_locals.get("self", None)
+            handler = frame.f_code.co_name if instance is None else f"{type(instance).__name__}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return handler
+
+_json_cache: dict[str, tuple[int, dict]] = {}
+
 def read_json(file_name: str, *path: list[str | int]):
-    """Read JSON object data from a file."""
+    """Read JSON object data from a file.
+    
+    Each file is parsed once and kept in memory until its modification time changes.
+    The returned data is shared between callers, so it should not be modified."""
     
-    with open(file_name, "r") as file:
-        position = json.load(file)
+    modified_time = os.stat(file_name).st_mtime_ns
+    cached = _json_cache.get(file_name, None)
+    if cached is None or cached[0] != modified_time:
+        with open(file_name, "r") as file:
+            cached = modified_time, json.load(file)
+        _json_cache[file_name] = cached
+
+    position = cached[1]
     for key in path:
         if key is None:
             return None
@@ -27,7 +56,7 @@ def read_sql(table_name: str, guild_id: int, column_name: str):
     query = f"SELECT {column_name} FROM {table_name} WHERE guild_id={guild_id};"
 
     try:
-        with psycopg2.connect(database_url, sslmode="require") as conn:
+        with psycopg2.connect(database_url, sslmode=DATABASE_SSLMODE) as conn:
             with conn.cursor() as cursor:
                 cursor.execute(query)
                 results = cursor.fetchall()
@@ -36,18 +65,142 @@ def read_sql(table_name: str, guild_id: int, column_name: str):
 
     return None if results == [] else results[0][0]
 
+def is_json_array(value: any) -> bool:
+    """Check whether a value needs to be stored as a SQL array of JSON objects."""
+
+    return isinstance(value, list) and all(isinstance(x, dict) for x in value)
+
 def write_sql(table_name: str, guild_id: int, column_name: str, value: any):
     """Write data to a single cell in a SQL table."""
     
     database_url = os.getenv("DATABASE_URL")
     query = f"INSERT INTO {table_name} (guild_id, {column_name}) VALUES (%(guild_id)s, %(value)s) ON CONFLICT (guild_id) DO UPDATE SET {column_name}=%(value)s;"
-    if isinstance(value, list) and all(isinstance(x, dict) for x in value):
+    if is_json_array(value):
         query = query.replace(r"%(value)s", r"%(value)s::json[]")
 
     try:
-        with psycopg2.connect(database_url, sslmode="require") as conn:
+        with psycopg2.connect(database_url, sslmode=DATABASE_SSLMODE) as conn:
             with conn.cursor() as cursor:
                 cursor.execute(query, {"guild_id": guild_id, "value": value})
             conn.commit()
+    finally:
+        conn.close()
+
+class WriteBehindBuffer:
+    """Hold writes to a SQL table's cells in memory, merging writes to the same cell, and write them all in one transaction.
+
+    Crash safety: a buffered write is only durable once a flush containing it has committed. Each flush is a single
+    transaction, so it is stored completely or not at all, and a failed flush keeps its writes pending for the next one
+    unless they have been overwritten in the meantime. Writes made since the last flush are lost if the process dies
+    without flushing, so the buffer must be flushed on shutdown, and writes that must survive a crash should use write_sql.
+    Reads with read_sql do not see writes that have not been flushed yet, so cells written through the buffer should be read with read."""
+
+    def __init__(self, table_name: str, max_pending: int = 100):
+        self.table_name = table_name
+        self.max_pending = max_pending
+        self.enabled = False
+        self.pending: dict[tuple[int, str], any] = {}
+
+    def write(self, guild_id: int, column_name: str, value: any):
+        """Buffer a write to a single cell, or write it immediately if buffering is disabled."""
+
+        if not self.enabled:
+            write_sql(self.table_name, guild_id, column_name, value)
+            self.pending.pop((guild_id, column_name), None) # Left over from a failed flush, and now out of date
+            return
+
+        self.pending[(guild_id, column_name)] = value
+        if len(self.pending) >= self.max_pending:
+            self.flush()
+
+    def read(self, guild_id: int, column_name: str):
+        """Read a single cell, including a write to it that has not been flushed yet."""
+
+        if (guild_id, column_name) in self.pending:
+            return self.pending[(guild_id, column_name)]
+        return read_sql(self.table_name, guild_id, column_name)
+
+    def discard(self, guild_id: int, column_name: str):
+        """Drop a pending write to a single cell, such as one this process is no longer responsible for."""
+
+        self.pending.pop((guild_id, column_name), None)
+
+    def flush(self):
+        """Write every pending cell in a single transaction, using one multi-row upsert for each set of columns written."""
+
+        if len(self.pending) == 0:
+            return
+        pending, self.pending = self.pending, {}
+
+        rows: dict[int, dict[str, any]] = {}
+        for (guild_id, column_name), value in pending.items():
+            rows.setdefault(guild_id, {})[column_name] = value
+        row_groups: dict[tuple[str, ...], list[tuple[int, dict[str, any]]]] = {}
+        for guild_id, row in rows.items():
+            row_groups.setdefault(tuple(sorted(row)), []).append((guild_id, row))
+
+        database_url = os.getenv("DATABASE_URL")
+        try:
+            with psycopg2.connect(database_url, sslmode=DATABASE_SSLMODE) as conn:
+                with conn.cursor() as cursor:
+                    for column_names, group in row_groups.items():
+                        values, params = [], []
+                        for guild_id, row in group:
+                            placeholders = ["%s"]
+                            params.append(guild_id)
+                            for column_name in column_names:
+                                placeholders.append(r"%s::json[]" if is_json_array(row[column_name]) else r"%s")
+                                params.append(row[column_name])
+                            values.append(f"({', '.join(placeholders)})")
+
+                        updates = ', '.join([f"{column_name}=EXCLUDED.{column_name}" for column_name in column_names])
+                        query = f"INSERT INTO {self.table_name} (guild_id, {', '.join(column_names)}) VALUES {', '.join(values)} ON CONFLICT (guild_id) DO UPDATE SET {updates};"
+                        cursor.execute(query, params)
+                conn.commit()
+        except Exception:
+            for key, value in pending.items():
+                self.pending.setdefault(key, value) # Newer writes to the same cell take priority
+            raise
+        finally:
+            if "conn" in locals():
+                conn.close()
+
+settings_writes = WriteBehindBuffer(DATABASE_SETTINGS)
+
+def claim_lease(table_name: str, lease_name: str, holder: str, duration: float) -> bool:
+    """Take or renew a lease row for the given holder, returning whether the holder now owns it.
+
+    The lease table needs the columns (lease_name TEXT PRIMARY KEY, holder TEXT, expires_at DOUBLE PRECISION).
+    A lease can only be taken over once its current holder has let it expire. Expiry times come from the database's
+    clock, so replicas with skewed clocks still agree on when a lease expires."""
+
+    database_url = os.getenv("DATABASE_URL")
+    query = f"""INSERT INTO {table_name} (lease_name, holder, expires_at) VALUES (%(lease_name)s, %(holder)s, extract(epoch from now()) + %(duration)s)
+        ON CONFLICT (lease_name) DO UPDATE SET holder=%(holder)s, expires_at=extract(epoch from now()) + %(duration)s
+        WHERE {table_name}.holder=%(holder)s OR {table_name}.expires_at<extract(epoch from now())
+        RETURNING holder;"""
+
+    try:
+        with psycopg2.connect(database_url, sslmode=DATABASE_SSLMODE) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, {"lease_name": lease_name, "holder": holder, "duration": duration})
+                result = cursor.fetchone()
+            conn.commit()
+    finally:
+        conn.close()
+
+    return result is not None and result[0] == holder
+
+def release_lease(table_name: str, lease_name: str, holder: str):
+    """Give up a lease early so that another replica can take it over without waiting for it to expire."""
+
+    database_url = os.getenv("DATABASE_URL")
+    query = f"DELETE FROM {table_name} WHERE lease_name=%(lease_name)s AND holder=%(holder)s;"
+
+    try:
+        with psycopg2.connect(database_url, sslmode=DATABASE_SSLMODE) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, {"lease_name": lease_name, "holder": holder})
+            conn.commit()
     finally:
         conn.close()
\ No newline at end of file
@@ -1,19 +1,29 @@
 import asyncio
 import os
+import traceback
 from dotenv import load_dotenv
 
 import discord
 from discord.ext import commands
 
-from cogfiles.copypastas import Copypastas
-from cogfiles.alerts import EventAlerts
-from cogfiles.streampause import StreamPause
-from cogfiles.reminders import Reminders
-from cogfiles.announcements import Announcements
-from cogfiles.music import Music
-from cogfiles.web_scrapers import WebScrapers
-from cogfiles.polling import Polling
-from cogfiles.birthdays import Birthdays
+
+# Extensions unloaded first on shutdown, in this order, since reloading an extension moves it to the end of the load order.
+# Scheduled jobs finish while their leases are still held, then their writes are flushed, and only then are the leases released.
+SHUTDOWN_ORDER = ["reminders", "announcements", "birthdays", "alerts", "write_behind", "leases"]
+
+class JenovaBot(commands.Bot):
+    async def close(self):
+        """Unload the extensions in SHUTDOWN_ORDER, then close the bot, which unloads the rest."""
+
+        for extension in SHUTDOWN_ORDER:
+            if f"cogfiles.{extension}" in self.extensions:
+                try:
+                    await self.unload_extension(f"cogfiles.{extension}")
+                except Exception:
+                    print(f"Failed to unload extension {extension!r} on shutdown:")
+                    traceback.print_exc()
+        await super().close()
+
 
 def main():
     load_dotenv()
@@ -23,13 +33,20 @@ def main():
     
     activity = discord.Game(name=stream_name)
     intents = discord.Intents.all()
-    bot = commands.Bot(command_prefix=command_prefix, activity=activity, intents=intents, enable_debug_events=True)
+    bot = JenovaBot(command_prefix=command_prefix, activity=activity, intents=intents, enable_debug_events=True)
 
-    cogs = Copypastas(bot), EventAlerts(bot), StreamPause(bot), Reminders(bot), Announcements(bot), Music(bot), WebScrapers(bot), Polling(bot), Birthdays(bot)
-    for cog in cogs:
-        asyncio.run(bot.add_cog(cog))
+    # Cogs are loaded as extensions, so that the reload command can swap them out while the bot is running
+    extensions = ["rest_accounting", "resolver", "copypastas", "alerts", "streampause", "reminders", "announcements", "music", "web_scrapers", "polling", "birthdays", "reloader"]
+    if os.getenv("WRITE_BEHIND") is not None: # Batch settings writes, flushing them before leases are released on shutdown (see SHUTDOWN_ORDER)
+        extensions.append("write_behind")
+    if os.getenv("ENABLE_LEASES") is not None: # Needed when running more than one replica of the bot
+        extensions.append("leases")
+    if os.getenv("DIAGNOSTICS") is not None: # Report event loop stalls and allow profiling
+        extensions.append("diagnostics")
+    for extension in extensions:
+        asyncio.run(bot.load_extension(f"cogfiles.{extension}"))
 
     bot.run(token)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,85 @@
+import os, re, sqlite3, sys, types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ioutils
+
+
+class SQLiteCursor:
+    """Stand-in for a psycopg2 cursor, translating psycopg2's parameter placeholders to SQLite's."""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.cursor = cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cursor.close()
+
+    def execute(self, query: str, params=None):
+        query = re.sub(r"%\((\w+)\)s", r":\1", query).replace("%s", "?").replace("extract(epoch from now())", "database_clock()")
+        self.cursor.execute(query, params or ())
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+class SQLiteConnection:
+    """Stand-in for a psycopg2 connection backed by a shared in-memory SQLite database, with a clock tests can move."""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.connection.commit()
+        else:
+            self.connection.rollback()
+
+    def cursor(self):
+        return SQLiteCursor(self.connection.cursor())
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        pass # The in-memory database only lives as long as its connection
+
+
+@pytest.fixture
+def lease_database(monkeypatch):
+    """A lease table in the Postgres database at TEST_DATABASE_URL, or in SQLite if it is not set.
+
+    Yields the SQLite database's clock, or None for Postgres, whose clock cannot be moved."""
+
+    create_query = f"CREATE TABLE {ioutils.DATABASE_LEASES} (lease_name TEXT PRIMARY KEY, holder TEXT, expires_at DOUBLE PRECISION);"
+    drop_query = f"DROP TABLE {ioutils.DATABASE_LEASES};"
+
+    database_url = os.getenv("TEST_DATABASE_URL")
+    if database_url is None:
+        clock = types.SimpleNamespace(now=1000.0)
+        connection = sqlite3.connect(":memory:")
+        connection.create_function("database_clock", 0, lambda: clock.now)
+        monkeypatch.setattr(ioutils.psycopg2, "connect", lambda *args, **kwargs: SQLiteConnection(connection))
+        connection.execute(create_query)
+        yield clock
+        connection.close()
+        return
+
+    monkeypatch.setenv("DATABASE_URL", database_url)
+    monkeypatch.setattr(ioutils, "DATABASE_SSLMODE", os.getenv("TEST_DATABASE_SSLMODE", default="disable"))
+    with ioutils.psycopg2.connect(database_url, sslmode=ioutils.DATABASE_SSLMODE) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(create_query)
+    yield None
+    with ioutils.psycopg2.connect(database_url, sslmode=ioutils.DATABASE_SSLMODE) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(drop_query)
@@ -0,0 +1,109 @@
+import asyncio, datetime, types
+
+import pytest
+import pytz
+
+from cogfiles import announcements
+from cogfiles.announcements import Announcements, CronSchedule
+
+
+EASTERN = pytz.timezone("US/Eastern")
+
+def test_next_fire_is_strictly_after():
+    schedule = CronSchedule("0 17 * * 5") # Fridays at 5:00 PM
+    friday = EASTERN.localize(datetime.datetime(2026, 10, 16, 17, 0))
+
+    assert schedule.next_fire(friday - datetime.timedelta(minutes=1), EASTERN) == friday.astimezone(pytz.utc)
+    assert schedule.next_fire(friday, EASTERN) == (friday + datetime.timedelta(days=7)).astimezone(pytz.utc)
+
+def test_restricted_day_and_weekday_either_match():
+    schedule = CronSchedule("0 0 13 * 5") # The 13th, or any Friday
+    after = EASTERN.localize(datetime.datetime(2026, 10, 10))
+    assert schedule.next_fire(after, EASTERN) == EASTERN.localize(datetime.datetime(2026, 10, 13)).astimezone(pytz.utc)
+
+@pytest.mark.parametrize("expression", ["0 17 * *", "60 * * * *", "* * 31 2 *", "*/0 * * * *"])
+def test_invalid_schedules_are_rejected(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression).next_fire(datetime.datetime.now(pytz.utc), EASTERN)
+
+def test_scheduler_survives_failed_announcements(monkeypatch):
+    monkeypatch.setattr(announcements, "read_sql", lambda *args: None)
+
+    async def run():
+        cog = Announcements(types.SimpleNamespace(get_cog=lambda name: None))
+        sent = []
+
+        async def send_announcement(guild_id, announcement):
+            if announcement["media"] == "broken":
+                raise RuntimeError("broken announcement")
+            sent.append(announcement["media"])
+
+        cog.send_announcement = send_announcement
+        past = datetime.datetime.now(pytz.utc) - datetime.timedelta(minutes=1)
+        for name in ("broken", "working"):
+            announcement = {"schedule": "* * * * *", "timezone": "UTC", "media": name}
+            cog.announcement_data.setdefault(1, {})[name] = announcement
+            cog.schedule(1, name, announcement, after=past - datetime.timedelta(minutes=1))
+
+        scheduler = asyncio.create_task(cog.run_scheduler())
+        await asyncio.sleep(0.1)
+        running = not scheduler.done()
+        scheduler.cancel()
+        return sent, running, len(cog.queue)
+
+    sent, running, queued = asyncio.run(run())
+    assert len(sent) > 0 and set(sent) == {"working"}
+    assert running
+    assert queued == 2 # Both announcements are scheduled again
+
+def test_unload_lets_sending_announcement_finish():
+    async def run():
+        cog = Announcements(types.SimpleNamespace(get_cog=lambda name: None))
+        started, release = asyncio.Event(), asyncio.Event()
+        sent = []
+
+        async def send_announcement(guild_id, announcement):
+            started.set()
+            await release.wait()
+            sent.append(announcement["media"])
+
+        cog.send_announcement = send_announcement
+        announcement = {"schedule": "* * * * *", "timezone": "UTC", "media": "slow"}
+        cog.announcement_data[1] = {"slow": announcement}
+        cog.schedule(1, "slow", announcement, after=datetime.datetime.now(pytz.utc) - datetime.timedelta(minutes=2))
+        cog._scheduler = asyncio.create_task(cog.run_scheduler())
+
+        await started.wait()
+        unload = asyncio.create_task(cog.cog_unload())
+        await asyncio.sleep(0)
+        release.set()
+        await unload
+        return sent, cog._scheduler
+
+    sent, scheduler = asyncio.run(run())
+    assert sent == ["slow"]
+    assert scheduler.done() and not scheduler.cancelled()
+
+def test_reload_keeps_queued_announcements():
+    async def run():
+        bot = types.SimpleNamespace(get_cog=lambda name: None, loop=asyncio.get_running_loop())
+        old_cog = Announcements(bot)
+        announcement = {"schedule": "0 0 1 1 *", "timezone": "UTC", "media": "new_year"}
+        old_cog.announcement_data[1] = {"new_year": announcement}
+        due = datetime.datetime.now(pytz.utc) - datetime.timedelta(seconds=1) # Became due while reloading
+        old_cog.queue.append((due, 5, 1, "new_year", announcement))
+
+        state = old_cog.export_state()
+        new_cog = Announcements(bot)
+        sent = []
+        async def send_announcement(guild_id, announcement):
+            sent.append(announcement["media"])
+        new_cog.send_announcement = send_announcement
+        await new_cog.import_state(state)
+        await asyncio.sleep(0.05)
+        await new_cog.cog_unload()
+        return sent, new_cog.queue
+
+    sent, queue = asyncio.run(run())
+    assert sent == ["new_year"]
+    assert [(name, order) for _, order, _, name, _ in queue] == [("new_year", 6)]
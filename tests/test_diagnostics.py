@@ -0,0 +1,59 @@
+import asyncio, collections, os, sys
+
+from ioutils import COGFILES_DIRECTORY, get_handler_name
+from cogfiles.diagnostics import Diagnostics
+
+
+# Compiled as if it were a cog file, since handlers are recognised by the directory their code is in
+FAKE_COG_SOURCE = """
+import time
+
+class FakeCog:
+    def handle(self, callback):
+        return self.helper(callback)
+
+    def helper(self, callback):
+        return callback()
+
+    async def block(self, seconds):
+        time.sleep(seconds)
+"""
+fake_cog_module = {}
+exec(compile(FAKE_COG_SOURCE, os.path.join(COGFILES_DIRECTORY, "fake_cog.py"), "exec"), fake_cog_module)
+FakeCog = fake_cog_module["FakeCog"]
+
+
+def outer(callback):
+    return inner(callback)
+
+def inner(callback):
+    return callback()
+
+
+def test_handler_is_outermost_cog_method():
+    assert FakeCog().handle(lambda: get_handler_name(sys._getframe(1))) == "FakeCog.handle"
+
+def test_handler_falls_back_to_innermost_function():
+    assert outer(lambda: get_handler_name(sys._getframe(1))) == "test_diagnostics.py:inner"
+
+def test_folded_stack_is_outermost_first():
+    stack = outer(lambda: Diagnostics.get_folded_stack(sys._getframe(1)))
+    assert stack.endswith("test_diagnostics.py:test_folded_stack_is_outermost_first;test_diagnostics.py:outer;test_diagnostics.py:inner")
+
+def test_folded_stacks_are_written_with_counts(tmp_path):
+    file_name = tmp_path / "profiles" / "profile.folded"
+    Diagnostics.write_folded_stacks(str(file_name), collections.Counter({"a;b;c": 3, "a;b": 1}))
+    assert file_name.read_text().splitlines() == ["a;b;c 3", "a;b 1"]
+
+def test_watchdog_counts_each_stall_once():
+    async def run():
+        cog = Diagnostics(None)
+        await cog.start_watching()
+        await asyncio.sleep(0.2)
+        await FakeCog().block(0.5)
+        await asyncio.sleep(0.2)
+        await cog.cog_unload()
+        cog._watchdog.join(1)
+        return cog.stalls
+
+    assert asyncio.run(run()) == {"FakeCog.block": 1}
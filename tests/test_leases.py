@@ -0,0 +1,92 @@
+import asyncio, types
+
+import pytest
+
+from ioutils import claim_lease, release_lease, DATABASE_LEASES
+from cogfiles import leases
+from cogfiles.leases import Leases, holds_lease, want_lease
+
+
+@pytest.fixture
+def clock(lease_database):
+    if lease_database is None:
+        pytest.skip("The Postgres clock cannot be moved")
+    return lease_database
+
+
+def test_first_claim_acquires_lease(lease_database):
+    assert claim_lease(DATABASE_LEASES, "announcements", "replica-1", 15)
+    assert not claim_lease(DATABASE_LEASES, "announcements", "replica-2", 15)
+
+def test_holder_renews_lease(clock):
+    assert claim_lease(DATABASE_LEASES, "announcements", "replica-1", 15)
+    clock.now += 10
+    assert claim_lease(DATABASE_LEASES, "announcements", "replica-1", 15)
+    clock.now += 10 # Past the first expiry, but not the renewed one
+    assert not claim_lease(DATABASE_LEASES, "announcements", "replica-2", 15)
+
+def test_expired_lease_is_taken_over(clock):
+    assert claim_lease(DATABASE_LEASES, "announcements", "replica-1", 15)
+    clock.now += 16
+    assert claim_lease(DATABASE_LEASES, "announcements", "replica-2", 15)
+    assert not claim_lease(DATABASE_LEASES, "announcements", "replica-1", 15)
+
+def test_expiry_ignores_replica_clocks(clock, monkeypatch):
+    assert claim_lease(DATABASE_LEASES, "announcements", "replica-1", 15)
+    monkeypatch.setattr("time.time", lambda: clock.now + 3600) # A replica whose clock runs an hour fast
+    assert not claim_lease(DATABASE_LEASES, "announcements", "replica-2", 15)
+
+def test_released_lease_is_taken_over_immediately(lease_database):
+    assert claim_lease(DATABASE_LEASES, "announcements", "replica-1", 15)
+    release_lease(DATABASE_LEASES, "announcements", "replica-2") # Not the holder, so nothing is released
+    assert not claim_lease(DATABASE_LEASES, "announcements", "replica-2", 15)
+
+    release_lease(DATABASE_LEASES, "announcements", "replica-1")
+    assert claim_lease(DATABASE_LEASES, "announcements", "replica-2", 15)
+
+def test_leases_are_independent(lease_database):
+    assert claim_lease(DATABASE_LEASES, "reminders:1", "replica-1", 15)
+    assert claim_lease(DATABASE_LEASES, "reminders:2", "replica-2", 15)
+
+
+class FakeBot:
+    def __init__(self):
+        self.cogs = {}
+        self.events = []
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name, None)
+
+    def dispatch(self, event: str, *args):
+        self.events.append((event, *args))
+
+@pytest.fixture
+def monotonic(monkeypatch):
+    monotonic = types.SimpleNamespace(now=500.0)
+    monkeypatch.setattr(leases.time, "monotonic", lambda: monotonic.now)
+    return monotonic
+
+def test_lease_stops_being_held_before_it_expires(monkeypatch, monotonic):
+    bot = FakeBot()
+    bot.cogs["Leases"] = cog = Leases(bot)
+    granted = {"value": True}
+    monkeypatch.setattr(leases, "claim_lease", lambda *args: granted["value"])
+    want_lease(bot, "birthdays")
+
+    asyncio.run(cog.renew_leases())
+    assert holds_lease(bot, "birthdays")
+    assert bot.events == [("lease_acquired", "birthdays")]
+
+    monotonic.now += leases.LEASE_DURATION - leases.LEASE_MARGIN # The renewal loop is running late
+    assert not holds_lease(bot, "birthdays")
+
+    granted["value"] = False
+    asyncio.run(cog.renew_leases())
+    assert bot.events == [("lease_acquired", "birthdays"), ("lease_lost", "birthdays")]
+
+def test_no_lease_is_held_without_the_cog_when_enabled(monkeypatch):
+    bot = FakeBot()
+    monkeypatch.setattr(leases, "LEASES_ENABLED", True)
+    assert not holds_lease(bot, "birthdays")
+    monkeypatch.setattr(leases, "LEASES_ENABLED", False)
+    assert holds_lease(bot, "birthdays") # A single replica owns every lease
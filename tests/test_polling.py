@@ -0,0 +1,59 @@
+import asyncio, types
+
+import discord
+import pytest
+
+from cogfiles import polling
+from cogfiles.polling import Poll, Polling
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, error: Exception = None):
+        self.id = message_id
+        self.error = error
+        self.edits = 0
+
+    async def edit(self, **kwargs):
+        self.edits += 1
+        if self.error is not None:
+            raise self.error
+
+def make_polling(*polls: Poll) -> Polling:
+    cog = Polling(types.SimpleNamespace(user=types.SimpleNamespace(id=0)))
+    for poll in polls:
+        cog.polls[poll.message.id] = poll
+    return cog
+
+def make_payload(message_id: int, emoji: str = "1️⃣"):
+    return types.SimpleNamespace(message_id=message_id, user_id=1, emoji=emoji)
+
+def http_error(error_type: type[discord.HTTPException], status: int) -> discord.HTTPException:
+    return error_type(types.SimpleNamespace(status=status, reason="error"), "error")
+
+
+def test_expired_polls_are_evicted(monkeypatch):
+    old_poll = Poll(FakeMessage(1), discord.Embed(), ["a", "b"], created_at=0)
+    new_poll = Poll(FakeMessage(2), discord.Embed(), ["a", "b"], created_at=polling.POLL_LIFETIME / 2)
+    cog = make_polling(old_poll, new_poll)
+
+    monkeypatch.setattr(polling.time, "monotonic", lambda: polling.POLL_LIFETIME + 1)
+    assert cog.get_poll(make_payload(1)) is None
+    assert cog.get_poll(make_payload(2)) is new_poll
+    assert list(cog.polls) == [2]
+
+@pytest.mark.parametrize("error", [http_error(discord.NotFound, 404), http_error(discord.Forbidden, 403)])
+def test_poll_is_dropped_when_message_cannot_be_edited(error):
+    poll = Poll(FakeMessage(1, error), discord.Embed(), ["a", "b"])
+    cog = make_polling(poll)
+
+    asyncio.run(cog.edit_poll(poll))
+    assert poll.message.edits == 1
+    assert 1 not in cog.polls
+
+def test_poll_is_kept_after_other_edit_errors(capsys):
+    poll = Poll(FakeMessage(1, http_error(discord.HTTPException, 500)), discord.Embed(), ["a", "b"])
+    cog = make_polling(poll)
+
+    asyncio.run(cog.edit_poll(poll))
+    assert cog.polls[1] is poll
+    assert "Failed to update poll 1" in capsys.readouterr().out
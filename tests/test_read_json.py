@@ -0,0 +1,25 @@
+import json, os
+
+from ioutils import read_json
+
+
+def write_json(path, data, modified_time: int):
+    path.write_text(json.dumps(data))
+    os.utime(path, ns=(modified_time, modified_time))
+
+def test_read_json_follows_path(tmp_path):
+    file_name = tmp_path / "config.json"
+    write_json(file_name, {"123": {"channel": 456}}, 1_000_000_000)
+
+    assert read_json(file_name, 123, "channel") == 456
+    assert read_json(file_name, 789) is None
+    assert read_json(file_name, None) is None
+
+def test_read_json_is_cached_until_modified(tmp_path):
+    file_name = tmp_path / "config.json"
+    write_json(file_name, {"phrase": "first"}, 1_000_000_000)
+    first = read_json(file_name)
+    assert read_json(file_name) is first
+
+    write_json(file_name, {"phrase": "second"}, 2_000_000_000)
+    assert read_json(file_name) == {"phrase": "second"}
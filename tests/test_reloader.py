@@ -0,0 +1,78 @@
+import asyncio
+
+import discord
+import pytest
+
+import ioutils
+from ioutils import settings_writes
+from jenovabot import JenovaBot
+
+
+@pytest.fixture
+def unloaded(monkeypatch):
+    monkeypatch.setattr(settings_writes, "pending", {})
+    monkeypatch.setattr(settings_writes, "enabled", False)
+    monkeypatch.setattr(ioutils.psycopg2, "connect", None) # Nothing is written, so nothing should connect
+    return []
+
+def test_shutdown_order_survives_reloads(monkeypatch, unloaded):
+    async def run():
+        bot = JenovaBot(command_prefix="!", intents=discord.Intents.none())
+        original_unload = bot.unload_extension
+        async def unload_extension(name, **kwargs):
+            unloaded.append(name.removeprefix("cogfiles."))
+            await original_unload(name, **kwargs)
+        monkeypatch.setattr(bot, "unload_extension", unload_extension)
+
+        for extension in ["resolver", "reminders", "write_behind", "leases", "reloader"]:
+            await bot.load_extension(f"cogfiles.{extension}")
+        await bot.reload_extension("cogfiles.write_behind") # Moves it to the end of the load order
+        await bot.reload_extension("cogfiles.reminders")
+        unloaded.clear()
+
+        await bot.close()
+        return list(bot.extensions)
+
+    assert asyncio.run(run()) == []
+    assert unloaded == ["reminders", "write_behind", "leases", "resolver", "reloader"] # Then the rest, in load order
+
+
+class FakeGuild:
+    def __init__(self, error: discord.HTTPException):
+        self.error = error
+
+    async def fetch_scheduled_event(self, event_id: int):
+        raise self.error
+
+class FakeEvent:
+    def __init__(self, event_id: int, guild: FakeGuild):
+        self.id = event_id
+        self.guild = guild
+
+def http_error(error_type: type[discord.HTTPException], status: int) -> discord.HTTPException:
+    return error_type(type("Response", (), {"status": status, "reason": "error"})(), "error")
+
+def test_reload_prunes_deleted_events_and_reports_failed_handoffs():
+    async def run():
+        bot = JenovaBot(command_prefix="!", intents=discord.Intents.none())
+        await bot.load_extension("cogfiles.alerts")
+        await bot.load_extension("cogfiles.reloader")
+        replies = []
+        async def send(message):
+            replies.append(message)
+        context = type("Context", (), {"send": staticmethod(send)})()
+        reloader = bot.get_cog("Reloader")
+
+        bot.get_cog("Event Alerts").yet_to_ping.add(FakeEvent(1, FakeGuild(http_error(discord.NotFound, 404))))
+        await reloader.reload.callback(reloader, context, "alerts")
+        pruned = bot.get_cog("Event Alerts").yet_to_ping.copy()
+
+        bot.get_cog("Event Alerts").yet_to_ping.add(FakeEvent(2, FakeGuild(http_error(discord.DiscordServerError, 500))))
+        await reloader.reload.callback(reloader, context, "alerts")
+        await bot.close()
+        return pruned, replies
+
+    pruned, replies = asyncio.run(run())
+    assert pruned == set()
+    assert replies[0].startswith("Reloaded `cogfiles.alerts`") and replies[0].endswith("ms.")
+    assert "some state was not handed over: Event Alerts:" in replies[1]
@@ -0,0 +1,53 @@
+import datetime, types
+
+from cogfiles.reminders import Reminder, ReminderStore
+
+
+def make_reminder(message_id: int, author_id: int, minutes: int) -> Reminder:
+    command_message = types.SimpleNamespace(id=message_id, author=types.SimpleNamespace(id=author_id))
+    return Reminder(command_message, datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=minutes), f"reminder {message_id}")
+
+
+def test_reminders_are_ordered_by_time():
+    store = ReminderStore([make_reminder(1, 10, 30), make_reminder(2, 20, 10), make_reminder(3, 10, 20)])
+
+    assert [reminder.command_message.id for reminder in store.all()] == [2, 3, 1]
+    assert [reminder.command_message.id for reminder in store.by_author(10)] == [3, 1]
+    assert [reminder.command_message.id for reminder in store.due(datetime.datetime(2026, 1, 1, 0, 20))] == [2, 3]
+    assert not store.changed
+
+def test_author_list_stays_live_after_emptying():
+    store = ReminderStore()
+    first = make_reminder(1, 10, 10)
+    store.add(first)
+    author_reminders = store.by_author(10)
+
+    store.remove(first)
+    assert author_reminders == []
+    second = make_reminder(2, 10, 20)
+    store.add(second)
+    assert author_reminders == [second]
+    assert store.by_author(10) is author_reminders
+
+def test_by_author_is_live_before_first_reminder():
+    store = ReminderStore()
+    author_reminders = store.by_author(10)
+    reminder = make_reminder(1, 10, 10)
+    store.add(reminder)
+    assert author_reminders == [reminder]
+
+def test_discard_ignores_missing_reminders():
+    store = ReminderStore([make_reminder(1, 10, 10)])
+    store.discard(make_reminder(2, 10, 10))
+    assert len(store) == 1
+    assert not store.changed
+
+def test_rebuilt_reminders_match_stored_ones():
+    store = ReminderStore([make_reminder(1, 10, 10), make_reminder(2, 10, 10)])
+    rebuilt = make_reminder(2, 10, 10)
+    assert rebuilt in store
+    assert make_reminder(2, 10, 20) not in store
+
+    store.remove(rebuilt)
+    assert [reminder.command_message.id for reminder in store.all()] == [1]
+    assert [reminder.command_message.id for reminder in store.by_author(10)] == [1]
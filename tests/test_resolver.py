@@ -0,0 +1,71 @@
+import asyncio, types
+
+from ioutils import current_handler
+from cogfiles.resolver import Resolver, resolve_channel, resolve_member
+
+
+class FakeBot:
+    def __init__(self, cached: dict[int, object], cogs: dict[str, object] = None):
+        self.cached = cached
+        self.cogs = cogs or {}
+        self.fetches = 0
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name, None)
+
+    def get_channel(self, channel_id: int):
+        return self.cached.get(channel_id, None)
+
+    async def fetch_channel(self, channel_id: int):
+        self.fetches += 1
+        await asyncio.sleep(0)
+        return f"fetched {channel_id}"
+
+caller = types.SimpleNamespace(qualified_name="Caller")
+
+
+def test_helpers_fall_back_without_resolver():
+    bot = FakeBot({1: "cached 1"})
+    guild = types.SimpleNamespace(get_member=lambda member_id: None, fetch_member=lambda member_id: asyncio.sleep(0, f"member {member_id}"))
+
+    async def run():
+        return await resolve_channel(bot, caller, 1), await resolve_channel(bot, caller, 2), await resolve_member(bot, caller, guild, 3)
+
+    assert asyncio.run(run()) == ("cached 1", "fetched 2", "member 3")
+    assert bot.fetches == 1
+
+def test_concurrent_lookups_share_one_fetch():
+    bot = FakeBot({})
+    resolver = Resolver(bot)
+    bot.cogs["Resolver"] = resolver
+
+    async def run():
+        first = await asyncio.gather(*[resolve_channel(bot, caller, 2) for _ in range(3)])
+        return first, await resolve_channel(bot, caller, 2)
+
+    first, cached = asyncio.run(run())
+    assert first == ["fetched 2"] * 3 and cached == "fetched 2"
+    assert bot.fetches == 1
+    assert resolver.rest_calls["Caller"] == 1
+    assert resolver.rest_calls_avoided["Caller"] == 3
+
+def test_fetch_task_is_attributed_to_calling_handler():
+    bot = FakeBot({})
+    resolver = Resolver(bot)
+    bot.cogs["Resolver"] = resolver
+    handlers = []
+
+    async def fetch_channel(channel_id: int):
+        handlers.append(current_handler.get())
+        return f"fetched {channel_id}"
+    bot.fetch_channel = fetch_channel
+
+    async def run():
+        await resolve_channel(bot, caller, 1) # Named from the stack
+        current_handler.set("Birthdays.send_birthday_message")
+        await resolve_channel(bot, caller, 2)
+        return current_handler.get()
+
+    assert asyncio.run(run()) == "Birthdays.send_birthday_message"
+    assert handlers[0] is not None
+    assert handlers[1] == "Birthdays.send_birthday_message"
@@ -0,0 +1,113 @@
+import asyncio, logging, os, types
+
+import discord
+import pytest
+from discord.http import Route
+
+from ioutils import COGFILES_DIRECTORY, current_handler
+from cogfiles.rest_accounting import RestAccounting
+
+
+# Compiled as if it were a cog file, since handlers are recognised by the directory their code is in
+FAKE_COG_SOURCE = """
+class FakeCog:
+    async def send_message(self, http, route):
+        return await http.request(route)
+"""
+fake_cog_module = {}
+exec(compile(FAKE_COG_SOURCE, os.path.join(COGFILES_DIRECTORY, "fake_cog.py"), "exec"), fake_cog_module)
+FakeCog = fake_cog_module["FakeCog"]
+
+http_log = logging.getLogger("discord.http")
+
+class FakeHTTP:
+    """Stand-in for discord.py's HTTP client, logging and raising what it would for a given response."""
+
+    def __init__(self):
+        self._bucket_hashes: dict[str, str] = {}
+        self.global_retry_after: float = None
+        self.rate_limited_after: float = None
+
+    async def request(self, route: Route, **kwargs):
+        if self.rate_limited_after is not None:
+            http_log.warning("We are being rate limited. %s %s responded with 429. Timeout of %.2f was too long, erroring instead.", route.method, route.url, self.rate_limited_after)
+            raise discord.RateLimited(self.rate_limited_after)
+        if self.global_retry_after is not None:
+            http_log.warning("We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds.", route.method, route.url, self.global_retry_after)
+            http_log.warning("Global rate limit has been hit. Retrying in %.2f seconds.", self.global_retry_after)
+        return {}
+
+def run_with_accounting(callback):
+    async def run():
+        bot = types.SimpleNamespace(http=FakeHTTP())
+        cog = RestAccounting(bot)
+        await cog.cog_load()
+        try:
+            await callback(bot.http)
+        finally:
+            await cog.cog_unload()
+        return cog
+
+    return asyncio.run(run())
+
+channel_route = Route("POST", "/channels/{channel_id}/messages", channel_id=1)
+
+
+def test_request_is_attributed_to_calling_cog_method():
+    cog = run_with_accounting(lambda http: FakeCog().send_message(http, channel_route))
+    [request] = cog.requests
+    assert request.handler == "FakeCog.send_message"
+    assert request.route == "POST /channels/{channel_id}/messages"
+
+def test_request_is_attributed_to_current_handler():
+    async def send(http):
+        current_handler.set("Birthdays.send_birthday_message")
+        await FakeCog().send_message(http, channel_route)
+
+    [request] = run_with_accounting(send).requests
+    assert request.handler == "Birthdays.send_birthday_message"
+
+def test_bucket_is_looked_up_by_route_key():
+    async def send(http):
+        http._bucket_hashes[channel_route.key] = "abcdef"
+        await http.request(channel_route)
+
+    [request] = run_with_accounting(send).requests
+    assert request.bucket == "abcdef"
+
+def test_global_rate_limit_is_counted_once():
+    async def send(http):
+        http.global_retry_after = 1.5
+        await http.request(channel_route)
+
+    [request] = run_with_accounting(send).requests
+    assert (request.rate_limits, request.retry_after) == (1, 1.5)
+
+def test_rate_limit_errors_are_counted():
+    async def send(http):
+        http.rate_limited_after = 30
+        with pytest.raises(discord.RateLimited):
+            await http.request(channel_route)
+
+    [request] = run_with_accounting(send).requests
+    assert (request.rate_limits, request.retry_after) == (1, 30)
+
+def test_report_ranks_handlers_by_calls():
+    async def send(http):
+        for _ in range(3):
+            await FakeCog().send_message(http, channel_route)
+        current_handler.set("Birthdays.send_birthday_message")
+        http.global_retry_after = 2
+        await http.request(Route("GET", "/users/{user_id}", user_id=2))
+
+    cog = run_with_accounting(send)
+    sent = []
+    async def send_report(embed):
+        sent.append(embed)
+    context = types.SimpleNamespace(send=send_report)
+    asyncio.run(cog.restreport.callback(cog, context, 60))
+
+    lines = sent[0].description.split("\n")
+    assert lines[0].startswith("1. **FakeCog.send_message** `POST /channels/{channel_id}/messages`: 3 calls")
+    assert lines[1].startswith("2. **Birthdays.send_birthday_message** `GET /users/{user_id}`: 1 calls")
+    assert lines[1].endswith(", 1 429s (2.0s retry)")
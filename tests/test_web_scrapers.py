@@ -0,0 +1,123 @@
+import asyncio, types
+
+import pytest
+from aiohttp import web
+
+from cogfiles import web_scrapers
+from cogfiles.web_scrapers import HostPolicy, HostUnavailableError, WebScrapers
+
+
+SONG_PAGE = "<html><head><title>Grateful Dead best Dark Star | headyversion</title></head><body></body></html>"
+
+async def start_stub_server(failing: dict[str, bool]) -> web.AppRunner:
+    """Serve just enough of HeadyVersion's search flow, answering with errors while failing["value"] is set."""
+
+    async def search_page(request: web.Request):
+        if failing["value"]:
+            raise web.HTTPInternalServerError()
+        response = web.Response(text="<html></html>")
+        response.set_cookie("csrftoken", "token")
+        return response
+
+    async def search(request: web.Request):
+        raise web.HTTPFound("/song/1/")
+
+    async def song(request: web.Request):
+        return web.Response(text=SONG_PAGE, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/search/", search_page)
+    app.router.add_post("/search/", search)
+    app.router.add_get("/song/1/", song)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner
+
+
+def test_breaker_opens_and_recovers_against_stub_server(monkeypatch):
+    async def run():
+        failing = {"value": True}
+        runner = await start_stub_server(failing)
+        port = runner.addresses[0][1]
+        monkeypatch.setattr(web_scrapers, "HEADYVERSION_URL", f"http://127.0.0.1:{port}")
+
+        cog = WebScrapers(types.SimpleNamespace())
+        policy = HostPolicy(f"127.0.0.1:{port}", failure_threshold=2, reset_timeout=0.2)
+        cog.hosts[policy.host] = policy
+        states = []
+        try:
+            for _ in range(2):
+                with pytest.raises(web_scrapers.aiohttp.ClientResponseError):
+                    await cog.heady_search("dark star")
+            states.append(policy.state)
+            with pytest.raises(HostUnavailableError):
+                await cog.heady_search("dark star")
+
+            await asyncio.sleep(0.25)
+            states.append(policy.state)
+            with pytest.raises(web_scrapers.aiohttp.ClientResponseError):
+                await cog.heady_search("dark star") # A failed trial opens the circuit again
+            states.append(policy.state)
+
+            await asyncio.sleep(0.25)
+            failing["value"] = False
+            title, url, description = await cog.heady_search("dark star")
+            states.append(policy.state)
+        finally:
+            await runner.cleanup()
+        return states, title, url
+
+    states, title, url = asyncio.run(run())
+    assert states == ["open", "half-open", "open", "closed"]
+    assert title == "HeadyVersion: Dark Star"
+    assert url.endswith("/song/1/")
+
+def test_only_one_trial_request_while_half_open():
+    async def run():
+        policy = HostPolicy("example.com", failure_threshold=1, reset_timeout=0)
+        policy.opened_at = 0 # Half-open straight away
+        trial_started, release_trial = asyncio.Event(), asyncio.Event()
+
+        async def trial():
+            async with policy.request():
+                trial_started.set()
+                await release_trial.wait()
+
+        task = asyncio.create_task(trial())
+        await trial_started.wait()
+        with pytest.raises(HostUnavailableError):
+            async with policy.request():
+                pass
+        release_trial.set()
+        await task
+        return policy.state
+
+    assert asyncio.run(run()) == "closed"
+
+def test_unknown_command_errors_are_logged(capsys):
+    cog = WebScrapers(types.SimpleNamespace())
+    context = types.SimpleNamespace(command="heady")
+    asyncio.run(cog.request_fail(context, web_scrapers.commands.CommandInvokeError(ValueError("unexpected page"))))
+    assert "ValueError: unexpected page" in capsys.readouterr().err
+
+def test_hltb_error_responses_count_as_failures(monkeypatch):
+    responses = []
+
+    class FakeHowLongToBeat:
+        async def async_search(self, game_name, similarity_case_sensitive):
+            return responses.pop(0)
+
+    monkeypatch.setattr(web_scrapers, "HowLongToBeat", FakeHowLongToBeat)
+
+    async def run():
+        cog = WebScrapers(types.SimpleNamespace())
+        policy = cog.host_policy(web_scrapers.HOWLONGTOBEAT_URL)
+        responses.extend([[], None])
+        assert await cog.hltb_search("no such game") is None # No matches, which is a successful search
+        assert policy.failures == 0
+        with pytest.raises(web_scrapers.aiohttp.ClientError):
+            await cog.hltb_search("celeste") # The client returns None for error responses
+        return policy.failures
+
+    assert asyncio.run(run()) == 1
@@ -0,0 +1,157 @@
+import asyncio
+
+import discord
+import pytest
+from discord.ext import commands
+
+import ioutils
+from ioutils import WriteBehindBuffer, settings_writes
+from cogfiles import write_behind
+from cogfiles.write_behind import WriteBehind
+from cogfiles.reminders import Reminders
+
+
+class RecordingConnection:
+    """Stand-in for a psycopg2 connection that records the queries committed through it."""
+
+    def __init__(self, database: "RecordingDatabase"):
+        self.database = database
+        self.queries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def cursor(self):
+        return self
+
+    def execute(self, query: str, params=None):
+        if self.database.failures > 0:
+            self.database.failures -= 1
+            raise ioutils.psycopg2.OperationalError("database unavailable")
+        self.queries.append((query, params))
+
+    def commit(self):
+        self.database.committed.append(self.queries)
+
+    def close(self):
+        pass
+
+class RecordingDatabase:
+    def __init__(self):
+        self.committed: list[list[tuple[str, list]]] = []
+        self.failures = 0
+
+@pytest.fixture
+def database(monkeypatch):
+    database = RecordingDatabase()
+    monkeypatch.setattr(ioutils.psycopg2, "connect", lambda *args, **kwargs: RecordingConnection(database))
+    return database
+
+@pytest.fixture
+def buffer():
+    buffer = WriteBehindBuffer("settings")
+    buffer.enabled = True
+    return buffer
+
+
+def test_flush_writes_latest_value_per_cell(database, buffer):
+    buffer.write(1, "birthdays", "old")
+    buffer.write(1, "birthdays", "new")
+    buffer.flush()
+
+    [[(query, params)]] = database.committed
+    assert params == [1, "new"]
+    assert buffer.pending == {}
+
+def test_flush_upserts_each_column_set_once(database, buffer):
+    buffer.write(1, "birthdays", "a")
+    buffer.write(2, "birthdays", "b")
+    buffer.write(3, "birthdays", "c")
+    buffer.write(3, "reminders", [{"reminder_str": "c"}])
+    buffer.flush()
+
+    [queries] = database.committed
+    assert len(queries) == 2
+    by_columns = {query.split("(", 2)[1].split(")")[0]: (query, params) for query, params in queries}
+    query, params = by_columns["guild_id, birthdays"]
+    assert query.count("%s") == 4 and "ON CONFLICT (guild_id) DO UPDATE SET birthdays=EXCLUDED.birthdays" in query
+    assert params == [1, "a", 2, "b"]
+    query, params = by_columns["guild_id, birthdays, reminders"]
+    assert "%s::json[]" in query
+    assert params == [3, "c", [{"reminder_str": "c"}]]
+
+def test_failed_flush_keeps_writes_without_overwriting_newer_ones(database, buffer):
+    buffer.write(1, "birthdays", "old")
+    buffer.write(2, "birthdays", "kept")
+    database.failures = 1
+    with pytest.raises(ioutils.psycopg2.OperationalError):
+        buffer.flush()
+    assert database.committed == []
+
+    buffer.write(1, "birthdays", "new")
+    buffer.flush()
+    [[(query, params)]] = database.committed
+    assert sorted(zip(params[::2], params[1::2])) == [(1, "new"), (2, "kept")]
+
+def test_read_sees_pending_writes(monkeypatch, database, buffer):
+    monkeypatch.setattr(ioutils, "read_sql", lambda table_name, guild_id, column_name: "stored")
+    buffer.write(1, "reminders", [])
+    assert buffer.read(1, "reminders") == []
+    assert buffer.read(2, "reminders") == "stored"
+
+def test_direct_write_discards_pending_write(database, buffer):
+    buffer.write(1, "birthdays", "stale")
+    buffer.enabled = False
+    buffer.write(1, "birthdays", "new")
+    assert buffer.pending == {}
+    assert database.committed[0][0][1] == {"guild_id": 1, "value": "new"}
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    monkeypatch.setattr(settings_writes, "pending", {})
+    monkeypatch.setattr(settings_writes, "enabled", False)
+    monkeypatch.setattr(write_behind, "UNLOAD_RETRY_DELAY", 0)
+    return commands.Bot(command_prefix="!", intents=discord.Intents.none())
+
+def test_unload_flushes_pending_writes(database, bot):
+    async def run():
+        await bot.add_cog(WriteBehind(bot))
+        settings_writes.write(1, "birthdays", "a")
+        assert database.committed == []
+        await bot.remove_cog("Write Behind")
+
+    asyncio.run(run())
+    assert len(database.committed) == 1
+    assert settings_writes.pending == {}
+    assert not settings_writes.enabled
+
+def test_unload_retries_and_keeps_unflushed_writes(database, bot):
+    async def run():
+        await bot.add_cog(WriteBehind(bot))
+        settings_writes.write(1, "birthdays", "a")
+        database.failures = write_behind.UNLOAD_FLUSH_ATTEMPTS - 1
+        await bot.remove_cog("Write Behind")
+        assert len(database.committed) == 1
+
+        await bot.add_cog(WriteBehind(bot))
+        settings_writes.write(1, "birthdays", "b")
+        database.failures = write_behind.UNLOAD_FLUSH_ATTEMPTS
+        await bot.remove_cog("Write Behind")
+
+    asyncio.run(run())
+    assert len(database.committed) == 1
+    assert settings_writes.pending == {(1, "birthdays"): "b"}
+
+def test_lost_reminders_lease_drops_pending_reminders(monkeypatch, database):
+    monkeypatch.setattr(settings_writes, "pending", {})
+    monkeypatch.setattr(settings_writes, "enabled", True)
+    settings_writes.write(1, "reminders", [{"reminder_str": "stale"}])
+    settings_writes.write(1, "birthdays", "kept")
+    settings_writes.write(2, "reminders", [{"reminder_str": "other server"}])
+
+    asyncio.run(Reminders(None).on_lease_lost("reminders:1"))
+    assert settings_writes.pending == {(1, "birthdays"): "kept", (2, "reminders"): [{"reminder_str": "other server"}]}